@@ -2,12 +2,12 @@
 
 import sys
 import time
+import json
 import random
+import functools
+import threading
 import numpy as np
 
-# We use syntactic sugar available in newer versions of Python
-print(sys.version)
-
 # Example 1: An identity decorator
 # this wraps, but does not otherwise modify, a function
 def identity_decorator(func):
@@ -27,6 +27,8 @@ def f(x):
     return x**2
 
 # Example 2: A timing wrapper
+# Note this changes what func returns, to (result, duration). To time
+# functions without changing them, see Example 4.
 def timerwrapper(func):
     def timedfunc(*args, **kwargs):
         start_time = time.time()
@@ -62,31 +64,164 @@ def prompt_before_run(func):
     
     return prompted
 
-# Using examples 2 and 3 on a 'random walk' function.
-@prompt_before_run
-def random_walk(n):
-    # a random walk with n steps
-    s = 0
-    for __ in range(n):
-        s += (random.random() -.5)*2
-    
-    return s
+# Example 4: An aggregating profiler
+# This keeps its timings to itself, so the function returns what it always
+# did. Each call is timed with perf_counter_ns, and counted into a histogram
+# for that function, with buckets 1/4 of a power of two wide (so percentiles
+# are within 12.5%). Histograms live in a registry shared by all threads.
+#
+#   @profile
+#   def hot_path(x): ...
+#
+#   print(profile.report())     # calls, mean, p50, p99, max per function
+#   profile.to_json('profile.json')
+#
+# When disabled, a call costs one extra function call and attribute check.
+# Decorating with @Profiler(enabled=False) and switching on later works too.
 
-walk_val = random_walk(1000)
-walk_val = random_walk(1000000)
+def _bucket(ns):
+    # Histogram bucket of a duration in ns: exact below 8, then 4 per power of 2
+    if ns < 8:
+        return ns
+    bits = ns.bit_length()
+    return (bits - 2) * 4 + ((ns >> (bits - 3)) & 3)
 
-# You can even use two!
 
-@timerwrapper
-@prompt_before_run
+def _bucket_middle(index):
+    # A duration in the middle of bucket index, inverting _bucket
+    if index < 8:
+        return index
+    bits, sub = divmod(index, 4)
+    width = 1 << (bits - 1)
+    return (4 + sub) * width + width // 2
 
-def random_walk(n):
-    # a random walk with n steps
-    s = 0
-    for __ in range(n):
-        s += (random.random() -.5)*2
-    
-    return s
 
-walk_val, runtime = random_walk(10000)
-print(f"Got value {walk_val:.2f} in time {runtime:.2f}")
+class Profiler:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        # [calls, total ns, max ns, histogram]
+        stats = self._stats.setdefault(name, [0, 0, 0, [0] * 256])
+        lock = self._lock
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                ns = time.perf_counter_ns() - start
+                index = _bucket(ns)
+                with lock:
+                    stats[0] += 1
+                    stats[1] += ns
+                    if ns > stats[2]:
+                        stats[2] = ns
+                    stats[3][index] += 1
+
+        return profiled
+
+    def reset(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats[:3] = [0, 0, 0]
+                stats[3][:] = [0] * len(stats[3])
+
+    def summary(self):
+        # {function name: {calls, total_ms, mean_us, p50_us, p99_us, max_us}}
+        with self._lock:
+            snapshot = {name: (calls, total, most, list(histogram))
+                        for name, (calls, total, most, histogram) in self._stats.items()}
+
+        summary = {}
+        for name, (calls, total, most, histogram) in snapshot.items():
+            if not calls:
+                continue
+            cumulative = np.cumsum(histogram)
+            p50, p99 = (
+                min(_bucket_middle(int(np.searchsorted(cumulative, q * calls))), most)
+                for q in (0.5, 0.99)
+            )
+            summary[name] = {
+                'calls': calls,
+                'total_ms': total / 1e6,
+                'mean_us': total / calls / 1e3,
+                'p50_us': p50 / 1e3,
+                'p99_us': p99 / 1e3,
+                'max_us': most / 1e3,
+            }
+        return summary
+
+    def report(self):
+        lines = [f"{'function':<40} {'calls':>10} {'total ms':>10} {'mean us':>10} "
+                 f"{'p50 us':>10} {'p99 us':>10} {'max us':>10}"]
+        for name, row in sorted(self.summary().items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<40} {row['calls']:>10} {row['total_ms']:>10.2f} "
+                         f"{row['mean_us']:>10.2f} {row['p50_us']:>10.2f} "
+                         f"{row['p99_us']:>10.2f} {row['max_us']:>10.2f}")
+        return '\n'.join(lines)
+
+    def to_json(self, path=None):
+        # The summary as JSON text, also written to path if given
+        text = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+# The registry most code should decorate with
+profile = Profiler()
+
+
+if __name__ == '__main__':
+    # We use syntactic sugar available in newer versions of Python
+    print(sys.version)
+
+    # Using examples 2 and 3 on a 'random walk' function.
+    @prompt_before_run
+    def random_walk(n):
+        # a random walk with n steps
+        s = 0
+        for __ in range(n):
+            s += (random.random() -.5)*2
+        
+        return s
+
+    walk_val = random_walk(1000)
+    walk_val = random_walk(1000000)
+
+    # You can even use two!
+
+    @timerwrapper
+    @prompt_before_run
+
+    def random_walk(n):
+        # a random walk with n steps
+        s = 0
+        for __ in range(n):
+            s += (random.random() -.5)*2
+        
+        return s
+
+    walk_val, runtime = random_walk(10000)
+    print(f"Got value {walk_val:.2f} in time {runtime:.2f}")
+
+    # Example 4, which returns the walk itself, and keeps the timings
+    @profile
+    def random_walk(n):
+        # a random walk with n steps
+        s = 0
+        for __ in range(n):
+            s += (random.random() -.5)*2
+        
+        return s
+
+    for n in [10, 100, 1000] * 100:
+        walk_val = random_walk(n)
+    print(profile.report())
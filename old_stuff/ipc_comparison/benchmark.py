@@ -0,0 +1,307 @@
+"""
+Benchmark of the sum protocol over different IPC transports.
+
+Every transport runs the same service as `server.py`/`client.py`: a request
+is some int64 values, and the reply is their `<q`-packed sum. With 16-byte
+messages and batches of 1 that is exactly the `server.py` protocol. The
+client sends a batch of requests back to back, then reads the batch of
+replies, and times each such round trip.
+
+Transports:
+ * `stream`:    AF_UNIX SOCK_STREAM, as in `server.py`
+ * `seqpacket`: AF_UNIX SOCK_SEQPACKET, one packet per message
+ * `pipe`:      a pair of `os.pipe`s
+ * `shm`:       the shared-memory rings from `shm_ring.py`
+
+For each transport, message size and batch size it reports messages per
+second, MB/s of requests, p50/p99/max round-trip latency, and the CPU time
+used per message by client and server together. The server runs in a forked
+child process, so this needs Linux (or another OS with `fork`).
+
+Usage:
+    python benchmark.py
+    python benchmark.py --transports stream shm --sizes 16 4096 --batches 1 64
+    python benchmark.py --json results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+from framing import recv_exactly_into
+from shm_ring import Ring
+
+REPLY = 8
+
+
+# Each transport is a function returning (client, server_main, server_ends).
+# client has send(batch) / recv(view) / close(). server_main(conn) runs in the
+# child, serves until the client hangs up, then sends its CPU time over conn.
+# server_ends are the sockets/fds only the child should keep open.
+
+def _sum(request):
+    return np.frombuffer(request, dtype='<i8').sum(dtype=np.int64).tobytes()
+
+
+def _serve_socket(sock, size, conn):
+    request = memoryview(bytearray(size))
+    while recv_exactly_into(sock, request):
+        sock.sendall(_sum(request))
+    conn.send(time.process_time())
+
+
+def _serve_seqpacket(sock, size, conn):
+    request = memoryview(bytearray(size))
+    while sock.recv_into(request, size):
+        sock.send(_sum(request))
+    conn.send(time.process_time())
+
+
+class SocketClient:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, batch):
+        self.sock.sendall(batch)
+
+    def recv(self, view):
+        recv_exactly_into(self.sock, view)
+
+    def close(self):
+        self.sock.close()
+
+
+class SeqpacketClient(SocketClient):
+    def __init__(self, sock, size):
+        super().__init__(sock)
+        self.size = size
+
+    def send(self, batch):
+        for start in range(0, len(batch), self.size):
+            self.sock.send(batch[start:start + self.size])
+
+    def recv(self, view):
+        for start in range(0, len(view), REPLY):
+            self.sock.recv_into(view[start:start + REPLY], REPLY)
+
+
+def stream(size, batch):
+    client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def server_main(conn):
+        client.close()
+        _serve_socket(server, size, conn)
+
+    return SocketClient(client), server_main, [server]
+
+
+def seqpacket(size, batch):
+    client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+    def server_main(conn):
+        client.close()
+        _serve_seqpacket(server, size, conn)
+
+    return SeqpacketClient(client, size), server_main, [server]
+
+
+class PipeClient:
+    def __init__(self, requests, replies):
+        self.requests = open(requests, 'wb', buffering=0)
+        self.replies = open(replies, 'rb', buffering=0)
+
+    def send(self, batch):
+        self.requests.write(batch)
+
+    def recv(self, view):
+        received = 0
+        while received < len(view):
+            received += self.replies.readinto(view[received:])
+
+    def close(self):
+        self.requests.close()
+        self.replies.close()
+
+
+def pipe(size, batch):
+    requests_r, requests_w = os.pipe()
+    replies_r, replies_w = os.pipe()
+
+    def server_main(conn):
+        os.close(requests_w)
+        os.close(replies_r)
+        requests = open(requests_r, 'rb', buffering=0)
+        replies = open(replies_w, 'wb', buffering=0)
+        request = memoryview(bytearray(size))
+        while True:
+            received = 0
+            while received < size:
+                nbytes = requests.readinto(request[received:])
+                if not nbytes:
+                    conn.send(time.process_time())
+                    return
+                received += nbytes
+            replies.write(_sum(request))
+
+    client = PipeClient(requests_w, replies_r)
+    return client, server_main, [requests_r, replies_w]
+
+
+class RingClient:
+    def __init__(self, requests, replies, doorbell, size):
+        self.requests = requests
+        self.replies = replies
+        self.doorbell = doorbell
+        self.width = size // 8
+
+    def send(self, batch):
+        for record in np.frombuffer(batch, dtype='<i8').reshape(-1, self.width):
+            self.requests.push(record, self.doorbell)
+
+    def recv(self, view):
+        out = np.frombuffer(view, dtype='<i8')
+        for ii in range(len(out)):
+            out[ii] = self.replies.pop(self.doorbell)[0]
+
+    def close(self):
+        self.doorbell.close()
+
+
+def shm(size, batch):
+    capacity = max(64, 2 * batch)
+    requests = Ring.create(capacity, size // 8)
+    replies = Ring.create(capacity, 1)
+    client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    for sock in (client, server):
+        sock.settimeout(0.01)
+
+    def server_main(conn):
+        client.close()
+        while True:
+            record = requests.pop(server)
+            if record is None:
+                conn.send(time.process_time())
+                return
+            replies.push((record.sum(),), server)
+
+    def cleanup():
+        for ring in (requests, replies):
+            ring.close()
+            ring.shm.unlink()
+
+    ring_client = RingClient(requests, replies, client, size)
+    ring_client.cleanup = cleanup
+    return ring_client, server_main, [server]
+
+
+TRANSPORTS = {
+    'stream': stream,
+    'seqpacket': seqpacket,
+    'pipe': pipe,
+    'shm': shm,
+}
+
+
+def run(transport, size, batch, rounds, warmup=100):
+    """Benchmark one (transport, message size, batch size) combination.
+
+    :return: dict of results, in JSON-friendly types
+    """
+    if size % 8 or size < 8:
+        raise ValueError("Message size must be a positive multiple of 8 bytes")
+    client, server_main, server_ends = TRANSPORTS[transport](size, batch)
+
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe()
+    server = context.Process(target=server_main, args=(child_conn,))
+    server.start()
+    # close the server's ends in this process, so EOF reaches the server
+    for end in server_ends:
+        if isinstance(end, int):
+            os.close(end)
+        else:
+            end.close()
+
+    values = np.arange(batch * size // 8, dtype='<i8')
+    expected = values.reshape(batch, -1).sum(axis=1)
+    request = values.tobytes()
+    replies = bytearray(batch * REPLY)
+    view = memoryview(replies)
+
+    latencies = np.empty(rounds, dtype=np.int64)
+    for __ in range(warmup):
+        client.send(request)
+        client.recv(view)
+    assert np.array_equal(np.frombuffer(replies, dtype='<i8'), expected)
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for ii in range(rounds):
+        round_start = time.perf_counter_ns()
+        client.send(request)
+        client.recv(view)
+        latencies[ii] = time.perf_counter_ns() - round_start
+    duration = time.perf_counter() - start
+    client_cpu = time.process_time() - cpu_start
+
+    client.close()
+    # The server's CPU time includes its warmup, which is small next to rounds
+    server_cpu = parent_conn.recv()
+    server.join()
+    if hasattr(client, 'cleanup'):
+        client.cleanup()
+
+    messages = rounds * batch
+    return {
+        'transport': transport,
+        'message_bytes': size,
+        'batch': batch,
+        'rounds': rounds,
+        'messages_per_s': messages / duration,
+        'request_mb_per_s': messages * size / duration / 1e6,
+        'p50_us': float(np.percentile(latencies, 50)) / 1e3,
+        'p99_us': float(np.percentile(latencies, 99)) / 1e3,
+        'max_us': float(latencies.max()) / 1e3,
+        'cpu_us_per_message': (client_cpu + server_cpu) / messages * 1e6,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--transports', nargs='+', default=list(TRANSPORTS),
+                        choices=list(TRANSPORTS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[16, 1024, 65536],
+                        help="Request sizes in bytes, multiples of 8")
+    parser.add_argument('--batches', nargs='+', type=int, default=[1, 8, 64],
+                        help="Requests per round trip. Keep batch * 1KB under the "
+                             "socket buffer size, or seqpacket replies can deadlock.")
+    parser.add_argument('--rounds', type=int, default=2000, help="Round trips to time")
+    parser.add_argument('--json', metavar='PATH',
+                        help="Also write the results as JSON to PATH ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = []
+    header = (f"{'transport':>10} {'bytes':>7} {'batch':>5} {'msg/s':>12} "
+              f"{'MB/s':>9} {'p50 us':>9} {'p99 us':>9} {'cpu us/msg':>10}")
+    print(header, file=sys.stderr)
+    for transport in args.transports:
+        for size in args.sizes:
+            for batch in args.batches:
+                result = run(transport, size, batch, args.rounds)
+                results.append(result)
+                print(f"{transport:>10} {size:>7} {batch:>5} "
+                      f"{result['messages_per_s']:>12,.0f} {result['request_mb_per_s']:>9.1f} "
+                      f"{result['p50_us']:>9.1f} {result['p99_us']:>9.1f} "
+                      f"{result['cpu_us_per_message']:>10.2f}", file=sys.stderr)
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
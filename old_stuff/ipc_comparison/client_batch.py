@@ -0,0 +1,45 @@
+"""
+The sum client, sending a whole batch of operand pairs per round trip to
+`server_batch.py` (see `framing.py`).
+
+Usage:
+    python client_batch.py
+    python client_batch.py --pairs 100000
+"""
+
+import argparse
+import socket
+import time
+
+import numpy as np
+
+from framing import FrameReader, send_frame
+
+ADDRESS = './some_filename.sock'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--address', default=ADDRESS, help="Path of the AF_UNIX socket")
+    parser.add_argument('--pairs', type=int, default=10000, help="Operand pairs per batch")
+    parser.add_argument('--rounds', type=int, default=100, help="Batches to send")
+    args = parser.parse_args()
+
+    # 1. Set up the socket and connect
+    clientsocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    clientsocket.connect(args.address)
+    reader = FrameReader()
+
+    # 2. Send batches of (x, y) pairs and receive their sums
+    pairs = np.random.randint(-2**31, 2**31, size=(args.pairs, 2))
+    start = time.perf_counter()
+    for __ in range(args.rounds):
+        send_frame(clientsocket, pairs)
+        sums = reader.read(clientsocket)
+    duration = time.perf_counter() - start
+
+    assert np.array_equal(sums, pairs.sum(axis=1))
+    print(f"{args.rounds * args.pairs / duration:,.0f} sums per second")
+
+    # 3. All done! Close the connection
+    clientsocket.close()
@@ -0,0 +1,292 @@
+"""
+Persistent, pooled clients for the sum protocol served by `server_multi.py`.
+
+`client_min.py` opens a socket, does one exchange and closes it, so every
+request pays for connection setup. `Client` keeps a pool of open connections
+and reuses them, and `add_many` pipelines many requests on each connection:
+it sends a window of requests before reading their replies, which arrive in
+order. `AsyncClient` does the same for `asyncio` code, where any number of
+coroutines can have requests in flight on the same connections at once.
+
+Example:
+
+    with Client(ADDRESS, size=4) as client:
+        client.add(7, 10)                        # 17
+        client.add_many([(1, 2), (3, 4)])        # [3, 7]
+
+    async with AsyncClient(ADDRESS, size=4) as client:
+        await client.add(7, 10)                  # 17
+        await client.add_many([(1, 2), (3, 4)])  # [3, 7]
+
+Usage (with `server_multi.py` running):
+    python client_pool.py
+"""
+
+import asyncio
+import collections
+import socket
+import struct
+import threading
+import time
+
+from framing import recv_exactly_into
+
+ADDRESS = './some_filename.sock'
+REQUEST = struct.Struct('<qq')
+RESPONSE = struct.Struct('<q')
+
+
+class Client:
+    """Thread-safe client with a pool of persistent connections.
+
+    Connections are opened lazily, up to `size` of them. Each call checks one
+    out, so up to `size` threads can make requests at the same time, and
+    others wait for one. A connection that fails is closed, freeing its place
+    for a new one.
+
+    :param address: Path of the server's AF_UNIX socket
+    :param size: Maximum number of open connections
+    :param window: Maximum requests in flight per connection in `add_many`.
+        Kept small enough that the replies fit in the socket buffer, so
+        neither side blocks writing while the other is not reading.
+    """
+
+    def __init__(self, address=ADDRESS, size=4, window=1024):
+        self.address = address
+        self.size = size
+        self.window = window
+        # guards the fields below, and is notified whenever a connection
+        # goes back to the pool or is closed, freeing room for a new one
+        self._available = threading.Condition()
+        self._idle = []              # open connections not in use, LIFO
+        self._open = 0               # connections open, idle or in use
+        self._busy = set()           # connections in use
+        self._stale = set()          # in use when close() ran: close on return
+
+    def _checkout(self):
+        with self._available:
+            while not self._idle and self._open >= self.size:
+                # the pool is at its size limit: wait for a connection
+                self._available.wait()
+            if self._idle:
+                sock = self._idle.pop()
+                self._busy.add(sock)
+                return sock
+            self._open += 1
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except BaseException:
+            sock.close()
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._busy.add(sock)
+        return sock
+
+    def _checkin(self, sock, broken=False):
+        with self._available:
+            self._busy.discard(sock)
+            if broken or sock in self._stale:
+                self._stale.discard(sock)
+                self._open -= 1
+                sock.close()
+            else:
+                self._idle.append(sock)
+            self._available.notify()
+
+    def _exchange(self, pairs):
+        sock = self._checkout()
+        try:
+            results = []
+            for start in range(0, len(pairs), self.window):
+                chunk = pairs[start:start + self.window]
+                sock.sendall(b''.join(REQUEST.pack(x, y) for x, y in chunk))
+                replies = bytearray(RESPONSE.size * len(chunk))
+                if not recv_exactly_into(sock, memoryview(replies)):
+                    raise ConnectionError("Server closed the connection")
+                results.extend(value for (value,) in RESPONSE.iter_unpack(replies))
+        except BaseException:
+            self._checkin(sock, broken=True)
+            raise
+        self._checkin(sock)
+        return results
+
+    def add(self, x, y):
+        return self._exchange([(x, y)])[0]
+
+    def add_many(self, pairs):
+        """Sum many pairs, pipelined on one pooled connection, in order."""
+        return self._exchange(list(pairs))
+
+    def close(self):
+        """Close idle connections now, and ones in use once they are returned."""
+        with self._available:
+            for sock in self._idle:
+                sock.close()
+            self._open -= len(self._idle)
+            self._idle = []
+            self._stale |= self._busy
+            self._available.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _AsyncConnection:
+    # One connection. Requests are written as they come, and a reader task
+    # resolves the futures of outstanding requests in the order they were sent.
+    # Once that task ends, the connection is dead: `closed` is set, and
+    # AsyncClient replaces it.
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = collections.deque()
+        self.closed = False
+        self.task = asyncio.create_task(self._read_replies())
+
+    async def _read_replies(self):
+        error = ConnectionError("Connection closed")
+        try:
+            while True:
+                data = await self.reader.readexactly(RESPONSE.size)
+                future = self.pending.popleft()
+                # the caller may have given up on it
+                if not future.done():
+                    future.set_result(RESPONSE.unpack(data)[0])
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            error = ConnectionError(str(exc))
+        finally:
+            self.closed = True
+            self.writer.close()
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    def request(self, x, y):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(REQUEST.pack(x, y))
+        return future
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class AsyncClient:
+    """asyncio client with a pool of persistent, pipelined connections.
+
+    Each request goes to the connection with the fewest requests in flight,
+    and any number of requests may be in flight on a connection at once.
+    Connections that fail are dropped and reopened on the next request, so
+    requests in flight on them fail, but later ones succeed.
+
+    :param address: Path of the server's AF_UNIX socket
+    :param size: Number of connections, opened on first use
+    """
+
+    def __init__(self, address=ADDRESS, size=4):
+        self.address = address
+        self.size = size
+        self._connections = []
+        self._connecting = None
+
+    async def _connect(self):
+        while len(self._connections) < self.size:
+            reader, writer = await asyncio.open_unix_connection(self.address)
+            self._connections.append(_AsyncConnection(reader, writer))
+
+    async def _ready(self):
+        # Drop dead connections, and open enough to make up the pool
+        dead = [connection for connection in self._connections if connection.closed]
+        if dead:
+            self._connections = [conn for conn in self._connections if not conn.closed]
+            for connection in dead:
+                await connection.close()
+        if len(self._connections) < self.size:
+            # one task opens them, however many requests are waiting on it
+            if self._connecting is None or self._connecting.done():
+                self._connecting = asyncio.ensure_future(self._connect())
+            await asyncio.shield(self._connecting)
+
+    async def add(self, x, y):
+        await self._ready()
+        connection = min(self._connections, key=lambda conn: len(conn.pending))
+        future = connection.request(x, y)
+        try:
+            # apply back-pressure if the server is not keeping up
+            await connection.writer.drain()
+        except ConnectionError:
+            # replace the connection, and don't leave its future unawaited
+            connection.closed = True
+            future.cancel()
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        return await future
+
+    async def add_many(self, pairs):
+        return await asyncio.gather(*(self.add(x, y) for x, y in pairs))
+
+    async def close(self):
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+        self._connecting = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _one_shot_add(x, y, address=ADDRESS):
+    # What client_min.py does for every request, for comparison
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    sock.sendall(REQUEST.pack(x, y))
+    reply = bytearray(RESPONSE.size)
+    recv_exactly_into(sock, memoryview(reply))
+    sock.close()
+    return RESPONSE.unpack(reply)[0]
+
+
+if __name__ == '__main__':
+    nn = 10000
+    pairs = [(ii, 2 * ii) for ii in range(nn)]
+    expected = [x + y for x, y in pairs]
+
+    start = time.perf_counter()
+    assert [_one_shot_add(x, y) for x, y in pairs] == expected
+    print(f"New connection per request: {nn / (time.perf_counter() - start):,.0f} sums per second")
+
+    with Client(ADDRESS) as client:
+        start = time.perf_counter()
+        assert [client.add(x, y) for x, y in pairs] == expected
+        print(f"Pooled connection:          {nn / (time.perf_counter() - start):,.0f} sums per second")
+
+        start = time.perf_counter()
+        assert client.add_many(pairs) == expected
+        print(f"Pooled and pipelined:       {nn / (time.perf_counter() - start):,.0f} sums per second")
+
+    async def main():
+        async with AsyncClient(ADDRESS) as client:
+            start = time.perf_counter()
+            assert await client.add_many(pairs) == expected
+            print(f"asyncio, pipelined:         {nn / (time.perf_counter() - start):,.0f} sums per second")
+
+    asyncio.run(main())
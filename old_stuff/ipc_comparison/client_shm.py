@@ -0,0 +1,31 @@
+"""
+The sum client from `client.py`, exchanging requests and responses through
+shared-memory ring buffers instead of the socket (see `shm_ring.py`).
+
+Usage:
+    python client_shm.py
+"""
+
+import time
+
+from shm_ring import ADDRESS, ShmClient
+
+if __name__ == '__main__':
+    # 1. Connect, and attach to the rings the server made for us
+    client = ShmClient(ADDRESS)
+
+    # 2. Send two integers, and receive the sum
+    result = client.add(7, 10)
+    print(f"Result formatted as {result}")
+
+    # 3. Many requests, pipelined through the rings
+    pairs = [(ii, 2 * ii) for ii in range(100000)]
+    start = time.perf_counter()
+    results = client.add_many(pairs)
+    duration = time.perf_counter() - start
+    assert results == [x + y for x, y in pairs]
+    print(f"{len(pairs) / duration:,.0f} sums per second")
+
+    # 4. All done! Close the connection
+    client.close()
+    print("All done!")
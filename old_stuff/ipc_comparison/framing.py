@@ -0,0 +1,163 @@
+"""
+Length-prefixed framing, so one message can carry many values.
+
+`server.py` assumes each `recv(8)` returns exactly one 8-byte integer, which
+only holds for tiny messages: `recv` may return fewer bytes than asked for.
+It also costs one syscall per value. Here every message is a *frame*:
+
+    header:  '<cxxxI'  -> typecode (b'q' int64 or b'd' float64), 3 pad bytes,
+                          number of values
+    payload: that many little-endian int64/float64 values
+
+Frames are sent with one `sendmsg` (header and payload, without joining them
+into a new bytes object) and received with `recv_into` into a reusable
+buffer, so receiving a frame does not allocate.
+
+Example, sending a batch of operand pairs to `server_batch.py`:
+
+    sock.connect(ADDRESS)
+    send_frame(sock, np.array([[7, 10], [1, 2]]))   # x0, y0, x1, y1
+    sums = FrameReader().read(sock)                 # array([17, 3])
+
+`send_array` and `recv_array` do the same for whole NumPy arrays of any
+dtype and shape, without copying them into (or out of) a bytes object:
+
+    send_array(sock, profiles)                      # e.g. shape (100000, 1440)
+    profiles = recv_array(other_sock)               # or recv_array(other_sock, out=buffer)
+"""
+
+import ast
+import struct
+
+import numpy as np
+
+HEADER = struct.Struct('<cxxxI')
+DTYPES = {b'q': np.dtype('<i8'), b'd': np.dtype('<f8')}
+TYPECODES = {dtype: typecode for typecode, dtype in DTYPES.items()}
+
+
+def sendmsg_all(sock, buffers):
+    """Like `sock.sendall`, but for a list of buffers sent with `sendmsg`."""
+    buffers = [memoryview(buf).cast('B') for buf in buffers]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        # drop whatever was sent; usually everything, in one call
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+
+def recv_exactly_into(sock, view):
+    """Fill view from sock, however many `recv_into` calls it takes.
+
+    :return: False if the connection closed before any byte arrived,
+        True once view is full
+    :raises ConnectionError: if the connection closed part-way through
+    """
+    received = 0
+    while received < len(view):
+        nbytes = sock.recv_into(view[received:])
+        if nbytes == 0:
+            if received == 0:
+                return False
+            raise ConnectionError("Connection closed in the middle of a frame")
+        received += nbytes
+    return True
+
+
+def send_frame(sock, values):
+    """Send values (int64 or float64, any shape) as one frame."""
+    values = np.asarray(values)
+    dtype = DTYPES[b'd'] if values.dtype.kind == 'f' else DTYPES[b'q']
+    values = np.ascontiguousarray(values, dtype=dtype)
+    header = HEADER.pack(TYPECODES[dtype], values.size)
+    sendmsg_all(sock, [header, values])
+
+
+# Length of the dtype description, then number of dimensions. The header is
+# followed by the description (as in a .npy file, so structured dtypes keep
+# their fields) and one ARRAY_DIM per dimension.
+ARRAY_HEADER = struct.Struct('<IB')
+ARRAY_DIM = struct.Struct('<Q')
+
+
+def send_array(sock, array):
+    """Send a NumPy array of any shape and (non-object) dtype.
+
+    The dtype and shape go in a small header, then the array's own memory is
+    handed to `sendmsg` as-is: no `tobytes()` copy is made, unless the array
+    is not C-contiguous.
+    """
+    array = np.asarray(array)
+    if not array.flags.c_contiguous:
+        array = array.copy(order='C')
+    if array.dtype.hasobject:
+        raise TypeError("Can not send arrays of Python objects")
+    descr = repr(np.lib.format.dtype_to_descr(array.dtype)).encode()
+    header = ARRAY_HEADER.pack(len(descr), array.ndim)
+    dims = b''.join(ARRAY_DIM.pack(dim) for dim in array.shape)
+    sendmsg_all(sock, [header + descr + dims, array.reshape(-1).view(np.uint8)])
+
+
+def recv_array(sock, out=None):
+    """Receive an array sent with `send_array`, straight into its final memory.
+
+    :param out: C-contiguous array to receive into, e.g. reused between
+        calls; it must match the dtype and shape that were sent. Defaults to
+        a new array.
+    :return: The received array (out, if given), or None if the connection
+        closed cleanly before the array
+    """
+    header = bytearray(ARRAY_HEADER.size)
+    if not recv_exactly_into(sock, memoryview(header)):
+        return None
+    descr_size, ndim = ARRAY_HEADER.unpack(header)
+    rest = bytearray(descr_size + ARRAY_DIM.size * ndim)
+    if not recv_exactly_into(sock, memoryview(rest)):
+        raise ConnectionError("Connection closed in the middle of an array")
+    # literal_eval only builds literals, unlike eval or pickle
+    descr = ast.literal_eval(rest[:descr_size].decode())
+    dtype = np.lib.format.descr_to_dtype(descr)
+    shape = tuple(dim for (dim,) in ARRAY_DIM.iter_unpack(rest[descr_size:]))
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape or out.dtype != dtype or not out.flags.c_contiguous:
+        raise ValueError(f"Expected a C-contiguous {dtype} array of shape {shape}")
+
+    view = memoryview(out.reshape(-1).view(np.uint8))
+    if not recv_exactly_into(sock, view) and len(view):
+        raise ConnectionError("Connection closed in the middle of an array")
+    return out
+
+
+class FrameReader:
+    """Receives frames into one buffer that is reused (and grown) across calls.
+
+    The array returned by `read` is a view of that buffer, so it is only
+    valid until the next call to `read`. Copy it to keep it.
+    """
+
+    def __init__(self, size=1 << 16):
+        self.buffer = bytearray(size)
+        self.header = bytearray(HEADER.size)
+
+    def read(self, sock):
+        """Receive one frame.
+
+        :return: The payload as an int64 or float64 array, or None if the
+            connection closed cleanly between frames
+        """
+        if not recv_exactly_into(sock, memoryview(self.header)):
+            return None
+        typecode, count = HEADER.unpack(self.header)
+        dtype = DTYPES[typecode]
+        nbytes = count * dtype.itemsize
+        if nbytes > len(self.buffer):
+            self.buffer = bytearray(max(nbytes, 2 * len(self.buffer)))
+        view = memoryview(self.buffer)[:nbytes]
+        if not recv_exactly_into(sock, view) and nbytes:
+            raise ConnectionError("Connection closed in the middle of a frame")
+        return np.frombuffer(view, dtype=dtype)
@@ -0,0 +1,59 @@
+"""
+The sum server, using framed batches (see `framing.py`) instead of one
+`recv(8)` per integer.
+
+Each request is one frame of 2n values: x0, y0, x1, y1, ... The reply is one
+frame of the n sums. A client may send as many frames as it likes, and each
+client is served on its own thread.
+
+Usage:
+    python server_batch.py
+    python server_batch.py --address ./some_filename.sock
+"""
+
+import argparse
+import os
+import socketserver
+
+from framing import FrameReader, send_frame
+
+ADDRESS = './some_filename.sock'
+
+
+def handle_batch(values):
+    """Sum each (x, y) pair of a flat x0, y0, x1, y1, ... array."""
+    return values.reshape(-1, 2).sum(axis=1)
+
+
+class BatchHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        reader = FrameReader()
+        while True:
+            values = reader.read(self.request)
+            if values is None:
+                # The client disconnected
+                return
+            send_frame(self.request, handle_batch(values))
+
+
+class BatchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--address', default=ADDRESS, help="Path of the AF_UNIX socket")
+    args = parser.parse_args()
+
+    if os.path.exists(args.address):
+        os.remove(args.address)
+
+    with BatchServer(args.address, BatchHandler) as server:
+        print(f"Serving on {args.address}...")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("All done!")
+        finally:
+            os.remove(args.address)
@@ -0,0 +1,204 @@
+"""
+A long-running version of `server.py` that serves many clients at once.
+
+It speaks the same protocol: the client sends two `<q`-packed integers, and
+the server sends back their `<q`-packed sum. Unlike `server.py`, a client may
+send as many pairs as it likes over one connection, the server handles
+thousands of connections concurrently with `asyncio`, and it keeps running
+until interrupted with Ctrl+C.
+
+`client.py` and `client_min.py` work unchanged against this server.
+
+With `--coalesce-us`, requests from all clients are gathered for up to that
+many microseconds (or until `--max-batch` pairs are waiting) and summed in
+one NumPy operation over a contiguous buffer, instead of one Python add per
+request. Under load this trades a bounded delay for much higher throughput.
+Sums then wrap around on int64 overflow, like NumPy does.
+
+`--coalesce-us 0` batches whatever requests arrive in the same turn of the
+event loop, adding no delay. asyncio timers are only accurate to about a
+millisecond on Linux, so small non-zero windows effectively wait that long.
+
+Usage:
+    python server_multi.py
+    python server_multi.py --workers 4 --address ./some_filename.sock
+    python server_multi.py --coalesce-us 50 --max-batch 4096
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ADDRESS = './some_filename.sock'
+REQUEST = struct.Struct('<qq')
+RESPONSE = struct.Struct('<q')
+
+
+def handle_request(x, y):
+    """The work done per request. Runs on the worker pool, if there is one."""
+    return x + y
+
+
+async def handle_client(reader, writer, pool=None):
+    # One coroutine per connected client, serving requests until it hangs up
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # readexactly copes with partial reads, unlike a bare recv(8)
+            x, y = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+            if pool is None:
+                result = handle_request(x, y)
+            else:
+                result = await loop.run_in_executor(pool, handle_request, x, y)
+            writer.write(RESPONSE.pack(result))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+        # The client disconnected
+        pass
+    finally:
+        writer.close()
+
+
+class Coalescer:
+    """Gathers operand pairs from every client and sums them in batches.
+
+    Pairs are copied into one preallocated (max_batch, 2) buffer. The batch
+    is summed with a single `np.add` when it is full, or `window` seconds
+    after its first pair arrived, whichever comes first. Each submitter then
+    gets its slice of the results, already packed as `<q` values.
+
+    :param window: Longest time a pair waits for others, in seconds. 0 sums
+        the batch once every client woken in this event-loop turn submitted.
+    :param max_batch: Most pairs summed at once
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.pairs = np.empty((max_batch, 2), dtype='<i8')
+        self.sums = np.empty(max_batch, dtype='<i8')
+        self.count = 0
+        self.waiting = []    # (start, count, future) per submission
+        self.timer = None
+
+    def submit(self, data):
+        """Queue the packed pairs in data; returns a future of the packed sums."""
+        pairs = np.frombuffer(data, dtype='<i8').reshape(-1, 2)
+        future = asyncio.get_running_loop().create_future()
+        if len(pairs) > self.max_batch:
+            # too big to share a batch: it is a batch of its own
+            future.set_result(np.add(pairs[:, 0], pairs[:, 1]).tobytes())
+            return future
+        if self.count + len(pairs) > self.max_batch:
+            self.flush()
+
+        self.pairs[self.count:self.count + len(pairs)] = pairs
+        self.waiting.append((self.count, len(pairs), future))
+        self.count += len(pairs)
+        if self.count == self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            loop = asyncio.get_running_loop()
+            if self.window > 0:
+                self.timer = loop.call_later(self.window, self.flush)
+            else:
+                self.timer = loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        count = self.count
+        np.add(self.pairs[:count, 0], self.pairs[:count, 1], out=self.sums[:count])
+        for start, length, future in self.waiting:
+            if not future.done():
+                future.set_result(self.sums[start:start + length].tobytes())
+        self.count = 0
+        self.waiting = []
+
+
+async def handle_client_coalesced(reader, writer, coalescer):
+    # Like handle_client, but passes every complete request that has arrived
+    # (a pipelining client may send many at once) to the coalescer together.
+    pending = b''
+    try:
+        while True:
+            data = await reader.read(1 << 16)
+            if not data:
+                # The client disconnected
+                return
+            pending += data
+            complete = len(pending) - len(pending) % REQUEST.size
+            if not complete:
+                continue
+            sums = await coalescer.submit(pending[:complete])
+            pending = pending[complete:]
+            writer.write(sums)
+            await writer.drain()
+    except (ConnectionResetError, BrokenPipeError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(address=ADDRESS, workers=0, backlog=4096, coalesce_us=None, max_batch=4096):
+    """Serve clients on the AF_UNIX socket at address, forever.
+
+    :param address: Path of the AF_UNIX socket
+    :param workers: Threads to run handle_request on. 0 runs it inline on the
+        event loop, which is fastest when requests are as cheap as an add.
+    :param backlog: Connections that may wait to be accepted
+    :param coalesce_us: If not None, sum requests from all clients in batches
+        (see `Coalescer`), waiting at most this many microseconds. workers is
+        then unused, as batches are summed on the event loop.
+    :param max_batch: Most pairs per batch, when coalescing
+    """
+    if os.path.exists(address):
+        os.remove(address)
+
+    pool = ThreadPoolExecutor(workers) if workers > 0 and coalesce_us is None else None
+    if coalesce_us is not None:
+        coalescer = Coalescer(coalesce_us / 1e6, max_batch)
+        handler = lambda reader, writer: handle_client_coalesced(reader, writer, coalescer)
+        mode = f"batches of up to {max_batch} within {coalesce_us} us"
+    else:
+        handler = lambda reader, writer: handle_client(reader, writer, pool)
+        mode = f"{workers} workers"
+    server = await asyncio.start_unix_server(handler, path=address, backlog=backlog)
+    print(f"Serving on {address} with {mode}...")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if os.path.exists(address):
+            os.remove(address)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--address', default=ADDRESS, help="Path of the AF_UNIX socket")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Worker threads for requests; 0 handles them inline")
+    parser.add_argument('--coalesce-us', type=float, default=None,
+                        help="Sum requests from all clients in batches, waiting at most "
+                             "this many microseconds (0: batch within one event-loop turn)")
+    parser.add_argument('--max-batch', type=int, default=4096,
+                        help="Most operand pairs per coalesced batch")
+    args = parser.parse_args()
+    if args.workers and args.coalesce_us is not None:
+        parser.error("--workers has no effect with --coalesce-us")
+
+    try:
+        asyncio.run(serve(
+            args.address, args.workers,
+            coalesce_us=args.coalesce_us, max_batch=args.max_batch,
+        ))
+    except KeyboardInterrupt:
+        print("All done!")
@@ -0,0 +1,198 @@
+"""
+A multi-process version of `server_multi.py`, to use every core.
+
+One Python process is limited by the GIL, so this "preforks" N worker
+processes, each running its own `asyncio` accept/compute loop for the sum
+protocol (two `<q`-packed integers in, their `<q`-packed sum out):
+
+ * Over TCP (`--port`), every worker binds its own listening socket to the
+   same port with SO_REUSEPORT, and the kernel spreads new connections
+   between them. (Linux balances these; other systems may not.)
+ * Over AF_UNIX (`--address`), SO_REUSEPORT does not apply, so the
+   supervisor creates the one listening socket and hands its file descriptor
+   to every worker, which all accept from it.
+
+The supervisor restarts any worker that dies, and prints the connections,
+requests and restarts of every worker every `--stats-interval` seconds.
+Workers count into a shared array, one row each, so stats cost no messages.
+
+Usage:
+    python server_prefork.py --workers 4
+    python server_prefork.py --workers 4 --port 12345
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+from server_multi import ADDRESS, REQUEST, RESPONSE, handle_request
+
+CONNECTIONS, REQUESTS, RESTARTS = range(3)
+STATS = ('connections', 'requests', 'restarts')
+
+
+async def _handle_client(reader, writer, stats, slot):
+    # handle_client from server_multi.py, counting into this worker's stats
+    stats[slot * len(STATS) + CONNECTIONS] += 1
+    try:
+        while True:
+            x, y = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+            writer.write(RESPONSE.pack(handle_request(x, y)))
+            stats[slot * len(STATS) + REQUESTS] += 1
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+        pass
+    finally:
+        writer.close()
+
+
+def _tcp_listener(host, port, backlog):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def worker_main(slot, stats, listen_fd=None, host=None, port=None, backlog=4096):
+    """Serve forever on the handed-off AF_UNIX listen_fd, or on (host, port)."""
+    # The supervisor's SIGTERM handler is inherited through fork: undo it, so
+    # terminate() just ends the worker instead of raising in its handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if listen_fd is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, fileno=listen_fd)
+    else:
+        sock = _tcp_listener(host, port, backlog)
+    sock.setblocking(False)
+
+    async def serve():
+        handler = lambda reader, writer: _handle_client(reader, writer, stats, slot)
+        if sock.family == socket.AF_UNIX:
+            # The path is shared by every worker, and the supervisor removes
+            # it: since Python 3.13 a closing server would unlink it otherwise
+            options = {'cleanup_socket': False} if sys.version_info >= (3, 13) else {}
+            server = await asyncio.start_unix_server(handler, sock=sock, **options)
+        else:
+            server = await asyncio.start_server(handler, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """Starts, watches and restarts the worker processes.
+
+    :param workers: Number of worker processes
+    :param address: Path of the AF_UNIX socket, if port is None
+    :param host: Interface to bind, for TCP
+    :param port: TCP port, or None to serve on address
+    """
+
+    def __init__(self, workers, address=ADDRESS, host='127.0.0.1', port=None, backlog=4096):
+        # fork, so workers inherit the listening socket's file descriptor
+        self.context = multiprocessing.get_context('fork')
+        self.stats = self.context.Array('q', workers * len(STATS), lock=False)
+        self.processes = [None] * workers
+        self.address = address
+        self.listener = None
+
+        if port is None:
+            if os.path.exists(address):
+                os.remove(address)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(address)
+            self.listener.listen(backlog)
+            self.worker_kwargs = {'listen_fd': self.listener.fileno()}
+        else:
+            self.worker_kwargs = {'host': host, 'port': port, 'backlog': backlog}
+
+    def _start(self, slot):
+        process = self.context.Process(
+            target=worker_main, args=(slot, self.stats), kwargs=self.worker_kwargs,
+            daemon=True,
+        )
+        process.start()
+        self.processes[slot] = process
+
+    def check_workers(self):
+        """Restart any worker that died."""
+        for slot, process in enumerate(self.processes):
+            if process is None or not process.is_alive():
+                if process is not None:
+                    print(f"Worker {slot} (pid {process.pid}) exited "
+                          f"with {process.exitcode}, restarting")
+                    self.stats[slot * len(STATS) + RESTARTS] += 1
+                self._start(slot)
+
+    def totals(self):
+        """Per-worker stats, as a list of dicts, plus a 'total' dict."""
+        rows = [
+            dict(zip(STATS, self.stats[slot * len(STATS):(slot + 1) * len(STATS)]))
+            for slot in range(len(self.processes))
+        ]
+        total = {name: sum(row[name] for row in rows) for name in STATS}
+        return rows, total
+
+    def run(self, stats_interval=5.0):
+        self.check_workers()
+        print(f"Serving with {len(self.processes)} workers...")
+        last_requests, last_time = 0, time.perf_counter()
+        try:
+            while True:
+                time.sleep(min(stats_interval, 0.5))
+                self.check_workers()
+                now = time.perf_counter()
+                if now - last_time < stats_interval:
+                    continue
+                rows, total = self.totals()
+                rate = (total['requests'] - last_requests) / (now - last_time)
+                print(f"{rate:,.0f} requests/s, {total['restarts']} restarts; " + ", ".join(
+                    f"worker {slot}: {row['requests']} req / {row['connections']} conn"
+                    for slot, row in enumerate(rows)
+                ))
+                last_requests, last_time = total['requests'], now
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join()
+        if self.listener is not None:
+            self.listener.close()
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Worker processes, defaults to one per core")
+    parser.add_argument('--address', default=ADDRESS, help="Path of the AF_UNIX socket")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind, with --port")
+    parser.add_argument('--port', type=int, default=None,
+                        help="Serve over TCP on this port, instead of AF_UNIX")
+    parser.add_argument('--stats-interval', type=float, default=5.0,
+                        help="Seconds between stats reports")
+    args = parser.parse_args()
+
+    # clean up on `kill` as on Ctrl+C (workers inherit this, too)
+    signal.signal(signal.SIGTERM, lambda *__: sys.exit(0))
+    supervisor = Supervisor(args.workers, args.address, args.host, args.port)
+    try:
+        supervisor.run(args.stats_interval)
+    except KeyboardInterrupt:
+        print("All done!")
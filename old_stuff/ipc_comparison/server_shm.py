@@ -0,0 +1,16 @@
+"""
+The sum server from `server.py`, exchanging requests and responses through
+shared-memory ring buffers instead of the socket (see `shm_ring.py`).
+
+Usage:
+    python server_shm.py
+"""
+
+from shm_ring import ADDRESS, ShmServer
+
+if __name__ == '__main__':
+    print(f"Serving on {ADDRESS}...")
+    try:
+        ShmServer(ADDRESS).serve_forever()
+    except KeyboardInterrupt:
+        print("All done!")
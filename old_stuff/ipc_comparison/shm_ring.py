@@ -0,0 +1,282 @@
+"""
+Shared-memory IPC for the sum service, using lock-free ring buffers.
+
+The README describes shared memory as the faster alternative to sockets;
+this implements it, and `benchmark.py` measures it. Each client
+gets two single-producer/single-consumer ring buffers in
+`multiprocessing.shared_memory`: one for requests (client -> server) and one
+for responses (server -> client). Messages are written straight into the
+rings with no syscall. The AF_UNIX socket is only used to set up the rings,
+and as a "doorbell": one byte that wakes the other side if it fell asleep
+waiting on an empty ring.
+
+Ring layout, all little-endian int64:
+
+    [0]            head: number of records ever pushed (written by producer)
+    [8]            tail: number of records ever popped (written by consumer)
+    [16]           1 while the consumer is asleep, waiting for the doorbell
+    [17]           number of times the consumer has gone to sleep
+    [24:]          capacity * width record slots
+
+head, tail and the sleeping flag sit on separate 64-byte cache lines. Each
+counter only ever has one writer, so no locks are needed. The producer rings
+the doorbell at most once per sleep, so unread doorbell bytes can never fill
+the socket buffer, however many records it pushes meanwhile. This relies on
+aligned 8-byte stores being atomic and stores not being reordered with other
+stores, which holds on x86-64. Doorbell waits use a short timeout, so a
+wakeup lost to load/store reordering costs at most that timeout.
+
+Example, matching `client.py`:
+
+    client = ShmClient(ADDRESS)
+    client.add(7, 10)                              # 17
+    client.add_many([(1, 2), (3, 4)])              # [3, 7], pipelined
+    client.close()
+
+And `server_shm.py` runs `ShmServer(ADDRESS).serve_forever()`.
+"""
+
+import os
+import socket
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+ADDRESS = './some_filename.sock'
+CAPACITY = 4096
+# polls of an empty/full ring before sleeping. Spinning only helps when the
+# other side runs on another core; on one core it just burns its time slice.
+SPIN = 2000 if (os.cpu_count() or 1) > 1 else 0
+DOORBELL_TIMEOUT = 0.01
+
+
+def _attach(name):
+    # Attach without the resource tracker unlinking the block when this
+    # process exits: its creator owns it.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class Ring:
+    """A single-producer/single-consumer ring of fixed-width int64 records."""
+
+    HEAD, TAIL, SLEEPING, SLEEPS = 0, 8, 16, 17
+    HEADER = 24
+
+    def __init__(self, shm, capacity, width):
+        self.shm = shm
+        self.capacity = capacity
+        self.width = width
+        self._ctrl = np.ndarray((self.HEADER,), dtype='<i8', buffer=shm.buf)
+        self._slots = np.ndarray(
+            (capacity, width), dtype='<i8', buffer=shm.buf, offset=self.HEADER * 8
+        )
+        # producer side: the sleep we last rang the doorbell for
+        self._rung = -1
+
+    @classmethod
+    def create(cls, capacity, width):
+        size = (cls.HEADER + capacity * width) * 8
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        ring = cls(shm, capacity, width)
+        ring._ctrl[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, capacity, width):
+        return cls(_attach(name), capacity, width)
+
+    def __len__(self):
+        return int(self._ctrl[self.HEAD] - self._ctrl[self.TAIL])
+
+    def try_push(self, record):
+        """Push one record, unless the ring is full. Producer side only."""
+        head = int(self._ctrl[self.HEAD])
+        if head - int(self._ctrl[self.TAIL]) >= self.capacity:
+            return False
+        self._slots[head % self.capacity] = record
+        # publish the record only after it is written
+        self._ctrl[self.HEAD] = head + 1
+        return True
+
+    def try_pop(self):
+        """Pop one record as a new array, or None if empty. Consumer side only."""
+        tail = int(self._ctrl[self.TAIL])
+        if tail == int(self._ctrl[self.HEAD]):
+            return None
+        record = self._slots[tail % self.capacity].copy()
+        # hand the slot back only after it is read
+        self._ctrl[self.TAIL] = tail + 1
+        return record
+
+    def pop(self, doorbell):
+        """Pop one record, sleeping on the doorbell socket if the ring stays empty.
+
+        :return: The record, or None if the producer hung up
+        """
+        while True:
+            for __ in range(SPIN):
+                record = self.try_pop()
+                if record is not None:
+                    return record
+            self._ctrl[self.SLEEPS] += 1
+            self._ctrl[self.SLEEPING] = 1
+            # re-check, in case a record arrived just before we set the flag
+            record = self.try_pop()
+            if record is not None:
+                self._ctrl[self.SLEEPING] = 0
+                return record
+            try:
+                if doorbell.recv(4096) == b'':
+                    return None
+            except socket.timeout:
+                pass
+            finally:
+                self._ctrl[self.SLEEPING] = 0
+
+    def push(self, record, doorbell):
+        """Push one record, waiting for space, and wake the consumer if asleep."""
+        spins = 0
+        while not self.try_push(record):
+            spins += 1
+            # the consumer is running, since the ring is full: just yield
+            time.sleep(0 if spins < SPIN else 1e-5)
+        if self._ctrl[self.SLEEPING]:
+            sleeps = int(self._ctrl[self.SLEEPS])
+            if sleeps != self._rung:
+                self._rung = sleeps
+                try:
+                    doorbell.send(b'!', socket.MSG_DONTWAIT)
+                except (BlockingIOError, socket.timeout):
+                    # a byte is already waiting, and will wake the consumer
+                    pass
+
+    def close(self):
+        del self._ctrl, self._slots
+        self.shm.close()
+
+
+class ShmClient:
+    """Client for `ShmServer`, with the same add-two-integers API as client.py."""
+
+    def __init__(self, address=ADDRESS):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        # 1. Receive the names of the rings, attach to them, and acknowledge
+        setup = b''
+        while not setup.endswith(b'\n'):
+            chunk = self.sock.recv(256)
+            if not chunk:
+                raise ConnectionError("Server closed the connection during setup")
+            setup += chunk
+        requests, responses, capacity = setup.decode().split()
+        self.requests = Ring.attach(requests, int(capacity), 2)
+        self.responses = Ring.attach(responses, int(capacity), 1)
+        self.sock.sendall(b'A')
+        self.sock.settimeout(DOORBELL_TIMEOUT)
+
+    def send(self, x, y):
+        """Queue one request. Pair with a later `recv`, in order."""
+        self.requests.push((x, y), self.sock)
+
+    def recv(self):
+        """Receive the result of the oldest outstanding request."""
+        record = self.responses.pop(self.sock)
+        if record is None:
+            raise ConnectionError("Server closed the connection")
+        return int(record[0])
+
+    def add(self, x, y):
+        self.send(x, y)
+        return self.recv()
+
+    def add_many(self, pairs):
+        """Pipeline many requests, keeping up to a ring's worth in flight."""
+        results = []
+        outstanding = 0
+        for x, y in pairs:
+            if outstanding == self.requests.capacity:
+                results.append(self.recv())
+                outstanding -= 1
+            self.send(x, y)
+            outstanding += 1
+        results.extend(self.recv() for __ in range(outstanding))
+        return results
+
+    def close(self):
+        self.sock.close()
+        self.requests.close()
+        self.responses.close()
+
+
+class ShmServer:
+    """Serves the sum protocol over shared-memory rings, one thread per client."""
+
+    def __init__(self, address=ADDRESS, capacity=CAPACITY):
+        self.address = address
+        self.capacity = capacity
+        if os.path.exists(address):
+            os.remove(address)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(address)
+        self.sock.listen(4096)
+
+    @staticmethod
+    def handle_request(x, y):
+        return x + y
+
+    def serve_client(self, connection):
+        requests = Ring.create(self.capacity, 2)
+        responses = Ring.create(self.capacity, 1)
+        unlinked = False
+        try:
+            # 1. Hand the rings to the client, then unlink them once it has
+            # attached: the memory lives on until both sides close it.
+            connection.sendall(
+                f"{requests.shm.name} {responses.shm.name} {self.capacity}\n".encode()
+            )
+            ack = connection.recv(1)
+            requests.shm.unlink()
+            responses.shm.unlink()
+            unlinked = True
+            if ack != b'A':
+                return
+            connection.settimeout(DOORBELL_TIMEOUT)
+
+            # 2. Serve requests until the client hangs up
+            while True:
+                record = requests.pop(connection)
+                if record is None:
+                    return
+                result = self.handle_request(int(record[0]), int(record[1]))
+                responses.push((result,), connection)
+        except OSError:
+            # the client hung up, or its socket failed
+            pass
+        finally:
+            connection.close()
+            if not unlinked:
+                # the client never attached: don't leave the blocks in /dev/shm
+                requests.shm.unlink()
+                responses.shm.unlink()
+            requests.close()
+            responses.close()
+
+    def serve_forever(self):
+        try:
+            while True:
+                connection, __ = self.sock.accept()
+                threading.Thread(
+                    target=self.serve_client, args=(connection,), daemon=True
+                ).start()
+        finally:
+            self.sock.close()
+            if os.path.exists(self.address):
+                os.remove(self.address)
@@ -5,17 +5,28 @@ A collection of various, unrelated functions that I use often.
 This is made by me for me, but you can use it too!
 '''
 
+import functools
+import json
+import math
+
+import numpy as np
+
 # todo:
 
 # simple socket client, server
 
 # normal map code
 
-def fib(nn: int) -> int:
+def fib(nn: int, cache: bool = True) -> int:
     '''Returns the nth value in the fibonacci sequence
 
+    Uses fast doubling, so this takes O(log nn) multiplications.
+    Results are kept in a bounded LRU cache of recent indices.
+
     :param nn: The index of the value to generate for the fibonacci sequence
     :type nn: int
+    :param cache: Whether to use the LRU cache, defaults to True
+    :type cache: bool, optional
     
     :raises ValueError: for values < 0
     :raises TypeError:  for non-int input
@@ -41,17 +52,123 @@ def fib(nn: int) -> int:
     Traceback (most recent call last):
     ...
     TypeError: Fibonacci sequence can only be indexed over integers
+    >>> fib(300, cache=False)
+    222232244629420445529739893461909967206666939096499764990979600
     
     '''
+    _check_fib_index(nn)
+    if cache:
+        return _fib_cached(nn)
+    return _fib_pair(nn)[0]
+
+
+def _check_fib_index(nn):
     if not type(nn) is int:
         raise TypeError("Fibonacci sequence can only be indexed over integers")
     if nn < 0:
         raise TypeError("Fibonacci sequence can not be evaluated on negative index")
-    vals = [0, 1]
-    for ii in range(0, nn):
-        vals[ii%2] += vals[(ii+1)%2]
+
+
+def _fib_pair(nn, mm=None):
+    '''Returns (fib(nn), fib(nn+1)), optionally mod mm, by fast doubling.
+
+    Walks the bits of nn from the top, using
+    F(2k) = F(k) * (2F(k+1) - F(k)) and F(2k+1) = F(k)^2 + F(k+1)^2,
+    so this takes O(log nn) big-int multiplications.
+    '''
+    aa, bb = 0, 1
+    for bit in bin(nn)[2:]:
+        cc = aa * (2*bb - aa)
+        dd = aa*aa + bb*bb
+        if mm is not None:
+            cc %= mm
+            dd %= mm
+        if bit == '1':
+            aa, bb = dd, cc + dd
+            if mm is not None:
+                bb %= mm
+        else:
+            aa, bb = cc, dd
+    
+    return aa, bb
+
+
+@functools.lru_cache(maxsize=256)
+def _fib_cached(nn):
+    return _fib_pair(nn)[0]
+
+
+def fib_mod(nn: int, mm: int) -> int:
+    '''Returns the nth value in the fibonacci sequence, modulo mm
+
+    Intermediate values are reduced mod mm, so this stays fast for huge nn.
+
+    :param nn: The index of the value to generate for the fibonacci sequence
+    :type nn: int
+    :param mm: The modulus
+    :type mm: int
+
+    :raises TypeError: for nn < 0, or non-int input
+    :raises ValueError: for mm < 1
+
+    :returns: fib(nn) % mm
+    :rtype: int
+
+    >>> fib_mod(10, 7)
+    6
+    >>> fib_mod(10**18, 10**9 + 7)
+    209783453
+    >>> fib_mod(5, 0)
+    Traceback (most recent call last):
+    ...
+    ValueError: Modulus must be a positive integer
+    '''
+    _check_fib_index(nn)
+    if not type(mm) is int:
+        raise TypeError("Modulus must be an integer")
+    if mm < 1:
+        raise ValueError("Modulus must be a positive integer")
+    return _fib_pair(nn, mm)[0]
+
+
+def fib_many(indices):
+    '''Returns fib(nn) for every nn in indices, sharing work between them.
+
+    Indices are visited in sorted order. Each value is stepped to from the
+    previous one, either one term at a time for small gaps, or with
+    F(k+d) = F(k)F(d+1) + F(k-1)F(d) for large ones.
+
+    :param indices: Indices to evaluate, in any order, repeats allowed
+    :type indices: Iterable[int]
+
+    :raises TypeError: for negative or non-int indices
+
+    :returns: The fibonacci values, in the order of indices
+    :rtype: list of int
+
+    >>> fib_many([10, 0, 4, 10, 1])
+    [55, 0, 3, 55, 1]
+    >>> fib_many([1000, 999])[0] == fib(1000, cache=False)
+    True
+    '''
+    indices = list(indices)
+    for nn in indices:
+        _check_fib_index(nn)
+    
+    values = {}
+    kk, aa, bb = 0, 0, 1   # aa, bb = F(kk), F(kk+1)
+    for nn in sorted(set(indices)):
+        gap = nn - kk
+        if gap < 64:
+            for __ in range(gap):
+                aa, bb = bb, aa + bb
+        else:
+            dd, dd1 = _fib_pair(gap)
+            aa, bb = aa*dd1 + (bb - aa)*dd, bb*dd1 + aa*dd
+        kk = nn
+        values[nn] = aa
     
-    return vals[nn%2]
+    return [values[nn] for nn in indices]
 
 
 def fibgen():
@@ -75,34 +192,352 @@ def fibgen():
     3
     """
     
-    vals = [0, 1]
-    ii = 0
+    aa, bb = 0, 1
     while True:
-        yield vals[ii%2]
-        vals[ii%2] += vals[(ii+1)%2]
-        ii += 1
+        yield aa
+        aa, bb = bb, aa + bb
 
-def equi_hash(n, a = 0.618033988749895, K = 131072):
+def equi_hash(n, a = 0.618033988749895, K = 131072, exact = False):
     """Hash integer n to range [0, K) using Equidistribution Theorem Hash, using irrational a.
 
     Is optimal for a = Phi = 1.618034.
     Because of mod 1, we use 0.618034.
 
+    n may also be an array of keys, in which case every key is hashed at once
+    and an int64 array of the same shape is returned.
+
+    With exact = True, the hash uses 64-bit fixed point instead of floats
+    (Fibonacci hashing by multiply-shift): a is rounded to a 64-bit odd
+    multiplier A, and the result is ((n * A) mod 2**64) * K // 2**64. This
+    is exact for every int64 n, so it agrees across machines and does not
+    degrade for large n like the float version does.
+
+    >>> equi_hash(12345)
+    82521
+    >>> equi_hash(np.array([12345, 0, 1]))
+    array([82521,     0, 81006])
+    >>> int(equi_hash(2**62 + 1, exact=True)) == int(equi_hash(np.array([2**62 + 1]), exact=True)[0])
+    True
+    >>> equi_hash(np.array([-1, 2**63 - 1]), K=1000, exact=True)
+    array([381, 881])
+
     :param n: Input to hash
-    :type n: int
+    :type n: int or np.ndarray of int
     :param a: Irrational number, defaults to 0.618033988749895
     :type a: float, optional
-    :param K: [description], defaults to 131072
+    :param K: Number of buckets, defaults to 131072.
+        With exact = True and array input, K must be at most 2**32.
     :type K: int, optional
+    :param exact: Use 64-bit fixed point instead of floats, defaults to False
+    :type exact: bool, optional
 
     :return: Result of the hash: An int in range [0, K)
-    :rtype: int
+    :rtype: int or np.ndarray of np.int64
     """
-    return math.floor(((n * a) % 1)*K)
+    if np.ndim(n) == 0:
+        if not exact:
+            return math.floor(((n * a) % 1)*K)
+        return (((int(n) * _fixed_point(a)) & _MASK_64) * int(K)) >> 64
+    
+    n = np.asarray(n)
+    if not exact:
+        return np.floor(np.mod(n * a, 1) * K).astype(np.int64)
+    
+    if n.dtype.kind not in 'iu':
+        raise TypeError("Exact equi_hash is only defined over integer keys")
+    # a NumPy integer K has no bit_length, and could overflow below
+    K = int(K)
+    if not 1 <= K <= 2**32:
+        raise ValueError("Exact equi_hash on arrays needs 1 <= K <= 2**32")
+    
+    # two's complement, so negative keys hash like (n mod 2**64)
+    h = n.astype(np.int64).view(np.uint64) * np.uint64(_fixed_point(a))
+    if K & (K - 1) == 0 and K > 1:
+        # power of two: just keep the top log2(K) bits
+        return (h >> np.uint64(65 - K.bit_length())).astype(np.int64)
+    # h * K // 2**64 without 128-bit ints, by splitting h into 32-bit halves
+    K = np.uint64(K)
+    hi = h >> np.uint64(32)
+    lo = h & np.uint64(0xFFFFFFFF)
+    return ((hi * K + ((lo * K) >> np.uint64(32))) >> np.uint64(32)).astype(np.int64)
+
 
+_MASK_64 = 2**64 - 1
 
 
-def flatten(x):
+def _fixed_point(a):
+    """a mod 1 as an odd 64-bit fixed-point multiplier."""
+    return int((a % 1) * 2**64) | 1
+
+
+
+class ShardMap:
+    """Route keys to N nodes through K fixed buckets, with minimal remapping.
+
+    Keys are hashed to one of K buckets with `equi_hash(..., exact=True)`,
+    and `table[bucket]` gives the owning node. Routing a batch of keys is one
+    vectorized hash plus one gather. Resizing only moves the buckets needed
+    to even out the load, so most keys keep their node.
+
+    >>> shards = ShardMap(3, K=1024)
+    >>> shards.route(np.array([1, 2, 3]))
+    array([2, 1, 1])
+    >>> shards.counts()
+    array([342, 341, 341])
+    >>> moved = shards.resize(4)
+    >>> len(moved), shards.counts().tolist()
+    (256, [256, 256, 256, 256])
+    >>> moved = shards.resize(3)
+    >>> len(moved), shards.counts().tolist()
+    (256, [342, 341, 341])
+
+    :param n_nodes: Number of nodes
+    :type n_nodes: int
+    :param K: Number of buckets, defaults to 131072. Fixed for the map's life.
+    :type K: int, optional
+    """
+
+    def __init__(self, n_nodes, K = 131072):
+        if n_nodes < 1 or n_nodes > K:
+            raise ValueError("Need 1 <= n_nodes <= K")
+        self.K = K
+        self.n_nodes = n_nodes
+        self.table = np.arange(K, dtype=np.int64) % n_nodes
+
+    def route(self, keys):
+        """Node for each key.
+
+        :param keys: Integer key(s)
+        :type keys: int or np.ndarray of int
+        :rtype: int or np.ndarray of np.int64
+        """
+        return self.table[equi_hash(keys, K=self.K, exact=True)]
+
+    def counts(self):
+        """Number of buckets owned by each node."""
+        return np.bincount(self.table, minlength=self.n_nodes)
+
+    def resize(self, n_nodes):
+        """Change the number of nodes, moving as few buckets as possible.
+
+        Every node ends up with K // n_nodes or K // n_nodes + 1 buckets.
+        Nodes that already hold the most buckets keep the extra ones.
+
+        :param n_nodes: New number of nodes
+        :type n_nodes: int
+        :return: Buckets that changed owner, e.g. to migrate cached data
+        :rtype: np.ndarray of np.int64
+        """
+        if n_nodes < 1 or n_nodes > self.K:
+            raise ValueError("Need 1 <= n_nodes <= K")
+        counts = np.bincount(self.table, minlength=max(n_nodes, self.n_nodes))
+
+        # the largest current owners get the K % n_nodes spare buckets
+        target = np.full(n_nodes, self.K // n_nodes)
+        target[np.argsort(-counts[:n_nodes], kind='stable')[:self.K % n_nodes]] += 1
+
+        # buckets grouped by owner: order[ends[node-1]:ends[node]]
+        order = np.argsort(self.table, kind='stable')
+        ends = np.cumsum(counts)
+        freed = []
+        for node in range(len(counts)):
+            keep = target[node] if node < n_nodes else 0
+            freed.append(order[ends[node] - counts[node] + keep:ends[node]])
+        freed = np.concatenate(freed)
+
+        deficit = np.maximum(target - counts[:n_nodes], 0)
+        self.table[freed] = np.repeat(np.arange(n_nodes), deficit)
+        self.n_nodes = n_nodes
+        return np.sort(freed)
+
+
+class FlatLayout:
+    """The structure of x, as needed to flatten anything shaped like it.
+
+    Built by one walk over a sample x, which records where each leaf goes in
+    the flat vector. `flatten(y, layout)` then fills a single preallocated
+    vector without checking types or measuring sizes again, which pays off
+    when flattening many states with the same structure (e.g. every entry of
+    model.grid_timeline).
+
+    Leaves are np.ndarrays (flattened in C order) and int/float/str/numpy
+    scalars (converted with float). Containers are dicts (by key), and
+    lists, tuples and sets (in iteration order).
+
+    :param x: A sample of the structure to flatten
+    :type x: dict | list | tuple | set | np.ndarray | float | int | str
+
+    :ivar size: Length of the flat vector
+    :ivar leaves: (path, offset, shape) of each leaf in flattened order,
+        where path is the tuple of keys/positions leading to it
+    """
+
+    def __init__(self, x):
+        self.size = 0
+        self.leaves = []
+        self._plan = self._compile(x, ())
+
+    def _compile(self, x, path):
+        # plans: int offset for scalars, slice for arrays,
+        # dict of key -> plan for dicts, list of plans for other iterables
+        if isinstance(x, np.ndarray):
+            plan = slice(self.size, self.size + x.size)
+            self.leaves.append((path, self.size, x.shape))
+            self.size += x.size
+            return plan
+        elif isinstance(x, dict):
+            return {k: self._compile(v, path + (k,)) for k, v in x.items()}
+        elif isinstance(x, (list, tuple, set)):
+            return [self._compile(v, path + (ii,)) for ii, v in enumerate(x)]
+        elif isinstance(x, (float, int, str, np.generic)):
+            plan = self.size
+            self.leaves.append((path, self.size, ()))
+            self.size += 1
+            return plan
+        raise TypeError(f"Can not flatten values of type {type(x).__name__}")
+
+    def flatten(self, x, out = None):
+        """Flatten x, which must have the structure this layout was built from.
+
+        :param x: Structure to flatten
+        :param out: Vector of length self.size to fill, defaults to a new one
+        :type out: np.ndarray, optional
+        :return: The flattened x
+        :rtype: np.ndarray
+        """
+        if out is None:
+            out = np.empty(self.size)
+        _fill(x, self._plan, out)
+        return out
+
+
+class FlatSchema(FlatLayout):
+    """A `FlatLayout` that can also name, rebuild and store the structure.
+
+    Compiled once from a sample structure, it gives each leaf's path, offset
+    and length, flattens with `flatten(x, out=...)` and inverts that with
+    `unflatten(vector)`, all without rebuilding key strings. `to_json` and
+    `from_json` let it be saved alongside a timeline of flattened states.
+
+    Sets are not supported, as they have no order to rebuild them in.
+
+    >>> state = {'a' : 1, 'b' : [2, np.array([[3, 4], [5, 6]])], 'c' : {'x' : 7}}
+    >>> schema = FlatSchema(state)
+    >>> schema.paths, schema.offsets.tolist(), schema.lengths.tolist()
+    (['a', 'b 0', 'b 1', 'c x'], [0, 1, 2, 6], [1, 1, 4, 1])
+    >>> schema.indices() == flatten_indices(state)
+    True
+    >>> vector = schema.flatten(state)
+    >>> vector
+    array([1., 2., 3., 4., 5., 6., 7.])
+    >>> schema.unflatten(vector * 10)
+    {'a': 10.0, 'b': [20.0, array([[30., 40.],
+           [50., 60.]])], 'c': {'x': 70.0}}
+    >>> FlatSchema.from_json(schema.to_json()).paths == schema.paths
+    True
+
+    :param x: A sample of the structure to flatten
+    :type x: dict | list | tuple | np.ndarray | float | int | str
+    :param sep: Separator for string representation of keys, defaults to ' '
+    :type sep: str, optional
+    """
+
+    def __init__(self, x, sep = ' '):
+        super().__init__(x)
+        self.sep = sep
+        self._skeleton = _skeleton(x)
+        self.paths = [sep.join(str(k) for k in path) for path, __, __ in self.leaves]
+        self.offsets = np.array([offset for __, offset, __ in self.leaves], dtype=np.int64)
+        self.lengths = np.array(
+            [math.prod(shape) for __, __, shape in self.leaves], dtype=np.int64
+        )
+
+    def indices(self):
+        """One name per element of the flat vector, as `flatten_indices` gives."""
+        indices = []
+        for path, (__, __, shape) in zip(self.paths, self.leaves):
+            if shape == ():
+                indices.append(path)
+            else:
+                prefix = path + self.sep if path else ''
+                indices.extend(
+                    prefix + self.sep.join(map(str, idx)) for idx in np.ndindex(shape)
+                )
+        return indices
+
+    def unflatten(self, vector):
+        """Rebuild the structure from a flat vector.
+
+        Scalar leaves come back as floats, and array leaves as views into
+        vector, reshaped to their original shape.
+
+        :param vector: A vector of length self.size, e.g. from `flatten`
+        :type vector: np.ndarray
+        :return: A structure shaped like the sample this schema was built from
+        """
+        return _unflatten(self._skeleton, vector, 0)[0]
+
+    def to_json(self):
+        """Serialize the schema to a JSON string."""
+        return json.dumps({'sep': self.sep, 'size': self.size, 'skeleton': self._skeleton})
+
+    @classmethod
+    def from_json(cls, text):
+        """Load a schema serialized with `to_json`."""
+        data = json.loads(text)
+        sample = _unflatten(data['skeleton'], np.zeros(data['size']), 0)[0]
+        return cls(sample, data['sep'])
+
+
+def _skeleton(x):
+    # JSON-able description of the containers and leaf shapes in x
+    if isinstance(x, np.ndarray):
+        return ['array', list(x.shape)]
+    elif isinstance(x, dict):
+        return ['dict', [[k, _skeleton(v)] for k, v in x.items()]]
+    elif isinstance(x, list):
+        return ['list', [_skeleton(v) for v in x]]
+    elif isinstance(x, tuple):
+        return ['tuple', [_skeleton(v) for v in x]]
+    elif isinstance(x, set):
+        raise TypeError("FlatSchema can not unflatten sets")
+    return ['scalar']
+
+
+def _unflatten(skeleton, vector, offset):
+    kind = skeleton[0]
+    if kind == 'scalar':
+        return float(vector[offset]), offset + 1
+    elif kind == 'array':
+        shape = tuple(skeleton[1])
+        size = math.prod(shape)
+        return vector[offset:offset + size].reshape(shape), offset + size
+    elif kind == 'dict':
+        out = {}
+        for k, child in skeleton[1]:
+            out[k], offset = _unflatten(child, vector, offset)
+        return out, offset
+    out = []
+    for child in skeleton[1]:
+        value, offset = _unflatten(child, vector, offset)
+        out.append(value)
+    return (tuple(out) if kind == 'tuple' else out), offset
+
+
+def _fill(x, plan, out):
+    if type(plan) is int:
+        out[plan] = float(x)
+    elif type(plan) is slice:
+        out[plan] = x.reshape(-1)
+    elif type(plan) is dict:
+        for k, sub in plan.items():
+            _fill(x[k], sub, out)
+    else:
+        for v, sub in zip(x, plan):
+            _fill(v, sub, out)
+
+
+def flatten(x, layout = None, out = None):
     """Recursively flatten x, where x can be:
      * A dict where leaf values are array-like or other iterable:
      * An array-like, or
@@ -110,26 +545,209 @@ def flatten(x):
 
     Useful for converting a model.grid_state dict to a raw numpy array.
 
+    The total size is measured first (see `FlatLayout`), then every leaf is
+    written into one preallocated vector. Pass a layout to skip the
+    measuring walk when flattening many values of the same structure.
+
     Example usage:
     flatten(model.grid_state)
 
     # Warning - can take about 1GB of RAM for 1440 timesteps.
     # will have 1441 elements.
-    timeline = np.stack([flatten(grid_state) for grid_state in model.grid_timeline])
+    timeline = flatten_many(model.grid_timeline)
+
+    >>> flatten({'a' : 1, 'b' : [1, 2, np.array([10, 20])], 'c' : {'x' : 100}})
+    array([  1.,   1.,   2.,  10.,  20., 100.])
+
+    :param x: Structure to flatten
+    :param layout: Layout of x, defaults to FlatLayout(x)
+    :type layout: FlatLayout, optional
+    :param out: Vector of length layout.size to fill, defaults to a new one
+    :type out: np.ndarray, optional
+    :rtype: np.ndarray
     """
-    if type(x) is np.ndarray:
-        return x
-    elif type(x) is dict:
-        return np.concatenate(np.array([flatten(x[k]) for k in x.keys()]))
-    elif type(x) in (list, tuple):
-        return np.concatenate(np.array([flatten(v) for v in x]))
-    elif type(x) is set:
-        return np.concatenate(np.array([flatten(v) for v in list(x)]))
-    elif type(x) in (float, int):
-        return np.array([float(x)])
-    elif type(x) is str:
-        return np.array([float(x)])
+    if layout is None:
+        layout = FlatLayout(x)
+    return layout.flatten(x, out)
+
 
+def flatten_many(xs, layout = None, out = None):
+    """Flatten a sequence of same-structured values into the rows of one array.
+
+    The layout is built once (from xs[0] by default) and reused for every
+    row, and the rows are written straight into one preallocated array.
+
+    >>> flatten_many([{'a': 1, 'b': [2, 3]}, {'a': 4, 'b': [5, 6]}])
+    array([[1., 2., 3.],
+           [4., 5., 6.]])
+
+    :param xs: Values to flatten, all with the same structure
+    :type xs: Sequence
+    :param layout: Layout shared by every value, defaults to FlatLayout(xs[0])
+    :type layout: FlatLayout, optional
+    :param out: Array of shape (len(xs), layout.size) to fill
+    :type out: np.ndarray, optional
+    :rtype: np.ndarray
+    """
+    xs = list(xs)
+    if layout is None:
+        layout = FlatLayout(xs[0]) if xs else FlatLayout([])
+    if out is None:
+        out = np.empty((len(xs), layout.size))
+    for row, x in zip(out, xs):
+        layout.flatten(x, row)
+    return out
+
+
+
+class TimelineStore:
+    """On-disk timeline of flattened states, backed by np.memmap.
+
+    States are flattened with a `FlatSchema` into the rows of a preallocated
+    (capacity, schema.size) float64 file, so a long simulation never has to
+    hold its timeline in RAM. Any timestep or column range can be read
+    without loading the rest of the file, and any number of processes can
+    open the same file read-only while it is being written.
+
+    File layout: a fixed 32-byte header (magic, count, capacity, length of
+    the JSON schema), the schema from `FlatSchema.to_json`, padding to 64
+    bytes, then the rows.
+
+    Example usage:
+
+    store = TimelineStore.create('timeline.bin', model.grid_state, capacity=1441)
+    for grid_state in model.grid_timeline:
+        store.append(grid_state)
+    store.close()
+
+    # elsewhere, in any number of processes
+    store = TimelineStore('timeline.bin')
+    store[1440]                      # one timestep
+    store.column('some key')         # one leaf over every timestep
+    store.state(10)                  # timestep 10, unflattened
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'timeline.bin')
+    >>> writer = TimelineStore.create(path, {'a': 0, 'b': np.zeros(2)}, capacity=4)
+    >>> for tt in range(3):
+    ...     writer.append({'a': tt, 'b': np.array([tt, -tt])})
+    >>> reader = TimelineStore(path)
+    >>> len(reader), reader[2]
+    (3, memmap([ 2.,  2., -2.]))
+    >>> reader.column('b')
+    memmap([[ 0.,  0.],
+            [ 1., -1.],
+            [ 2., -2.]])
+    >>> reader.state(1)
+    {'a': 1.0, 'b': memmap([ 1., -1.])}
+
+    :param path: File created by `TimelineStore.create`
+    :type path: str
+    :param mode: 'r' to open read-only, or 'r+' to append, defaults to 'r'
+    :type mode: str, optional
+    """
+
+    MAGIC = int.from_bytes(b'LKTLINE1', 'little')
+    HEADER_BYTES = 32
+    ALIGN = 64
+
+    def __init__(self, path, mode = 'r'):
+        self.path = path
+        self.mode = mode
+        self._header = np.memmap(path, dtype='<u8', mode=mode, shape=(4,))
+        magic, __, capacity, schema_len = (int(v) for v in self._header)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a TimelineStore file")
+        with open(path, 'rb') as file:
+            file.seek(self.HEADER_BYTES)
+            self.schema = FlatSchema.from_json(file.read(schema_len).decode())
+        self.capacity = capacity
+        self.data = np.memmap(
+            path, dtype='<f8', mode=mode,
+            offset=self._data_offset(schema_len),
+            shape=(capacity, self.schema.size),
+        )
+
+    @classmethod
+    def _data_offset(cls, schema_len):
+        return -(-(cls.HEADER_BYTES + schema_len) // cls.ALIGN) * cls.ALIGN
+
+    @classmethod
+    def create(cls, path, sample, capacity, sep = ' '):
+        """Create an empty store for states shaped like sample, open for appending.
+
+        :param path: File to create, overwriting it if it exists
+        :type path: str
+        :param sample: A state, used to build the `FlatSchema`
+        :param capacity: Maximum number of timesteps
+        :type capacity: int
+        :param sep: Separator for the schema's paths, defaults to ' '
+        :type sep: str, optional
+        :rtype: TimelineStore
+        """
+        schema = FlatSchema(sample, sep)
+        header = schema.to_json().encode()
+        offset = cls._data_offset(len(header))
+        with open(path, 'wb') as file:
+            file.write(np.array([cls.MAGIC, 0, capacity, len(header)], dtype='<u8').tobytes())
+            file.write(header)
+            # sparse on most filesystems, so this does not write capacity rows
+            file.truncate(offset + capacity * schema.size * 8)
+        return cls(path, mode='r+')
+
+    def __len__(self):
+        # re-read, so readers see rows appended after they opened the file
+        return int(self._header[1])
+
+    def __getitem__(self, idx):
+        """Index the (len(self), schema.size) array of stored rows."""
+        return self.data[:len(self)][idx]
+
+    def append(self, state):
+        """Flatten state into the next row."""
+        count = len(self)
+        if count >= self.capacity:
+            raise ValueError("TimelineStore is full")
+        self.schema.flatten(state, out=self.data[count])
+        # publish the row only after it is written
+        self._header[1] = count + 1
+
+    def extend(self, states):
+        """Append every state in states."""
+        for state in states:
+            self.append(state)
+
+    def column(self, path):
+        """One leaf, by its schema path, across every stored timestep.
+
+        :param path: An entry of self.schema.paths
+        :type path: str
+        :return: Array of shape (len(self),) + the leaf's shape
+        :rtype: np.memmap
+        """
+        ii = self.schema.paths.index(path)
+        __, offset, shape = self.schema.leaves[ii]
+        columns = self[:, offset:offset + int(self.schema.lengths[ii])]
+        return columns.reshape((len(columns),) + shape) if shape else columns[:, 0]
+
+    def state(self, tt):
+        """Timestep tt, unflattened (see `FlatSchema.unflatten`)."""
+        return self.schema.unflatten(self[tt])
+
+    def flush(self):
+        if self.mode != 'r':
+            self.data.flush()
+            self._header.flush()
+
+    def close(self):
+        self.flush()
+        del self.data, self._header
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 # return a flat list of float, int, str
@@ -138,14 +756,19 @@ def flatten(x):
 def flatten_indices(x, sep = ' ', depth=0, max_depth=-1):
     """Recursively flatten the indices of an iterable to a list of strings.
 
+    Entry ii names element ii of flatten(x). See `FlatSchema` to compute
+    this once and reuse it.
+
     >>> flatten({'a' : 1, 'b' : [1, 2, [10, 20]], 'c'  : {'x' : 100, 'y' : 200}})
-    [1, 1, 2, 10, 20, 100, 200]
-    >>> flatten_indices(flatten({'a' : 1, 'b' : [1, 2, [10, 20]], 'c'  : {'x' : 100, 'y' : 200}}))
+    array([  1.,   1.,   2.,  10.,  20., 100., 200.])
+    >>> flatten_indices({'a' : 1, 'b' : [1, 2, [10, 20]], 'c'  : {'x' : 100, 'y' : 200}})
     ['a', 'b 0', 'b 1', 'b 2 0', 'b 2 1', 'c x', 'c y']
+    >>> flatten_indices({'a' : 1, 'b' : [1, np.array([10, 20])]}, sep='.', max_depth=2)
+    ['a', 'b.0', 'b.1']
 
 
     :param x: An iterable or value.
-    :type x: dict | float | int | str | None
+    :type x: dict | list | tuple | set | np.ndarray | float | int | str | None
     :param sep: Separator for string representation of keys, defaults to ' '
     :type sep: str, optional
     :param depth: Current depth, defaults to 0
@@ -160,18 +783,25 @@ def flatten_indices(x, sep = ' ', depth=0, max_depth=-1):
         # Do not return anything deeper than this depth
         return None
     
-    if type(x) in (float, int, str):
+    if isinstance(x, (float, int, str, np.generic)):
+        return None
+    elif type(x) is np.ndarray and x.ndim == 0:
         return None
     elif type(x) is dict:
         indices = x.keys()
-    elif type(x) in (list, tuple):
+    elif type(x) is set:
+        x = list(x)
+        indices = range(len(x))
+    elif type(x) in (list, tuple, np.ndarray):
         indices = range(len(x))
+    else:
+        raise TypeError(f"Can not flatten values of type {type(x).__name__}")
     
     flattened_indices = []
     
     for idx in indices:
         child = x[idx]
-        child_indices = flatten_indices(child, depth+1)
+        child_indices = flatten_indices(child, sep, depth+1, max_depth)
         
         if child_indices is None:
             # child is float, int, or str
@@ -62,27 +62,51 @@ for ii in range(13):
         [pert_node_functions[ii](xx) for xx in range(1440)]
     )
 
+
+Example usage to evaluate many (unperturbed) profiles over a whole day at once:
+
+params = stack_params([generate_parameters() for ii in range(1000)])
+day = ff_batch(np.arange(1440), params.AA, params.BB, params.CC)
+# day.shape == (1000, 1440)
+
 Provides:
 
 ff(xx, AA, BB, CC)
 
+ff_batch(xx, AA, BB, CC)
+
 Params(self, AA, BB, CC)
 
-generate_parameters(AA, BB, CC)
+generate_parameters(AA, BB, CC, rng)
+
+stack_params(params)
 
 ff_with_params(ff, params)
 
-p_hv(xx, scale)
+p_hv(xx, scale, rng)
 
 pp(ff, p_h, p_v)
 
+get_rng(rng)
+
+profile_rngs(seed, start, stop)
+
+ProfileBank(AA, BB, CC, h_scale, v_scale)
+
+synthesize_profiles(nn, minutes, workers, seed, chunk_size, perturb, **kwargs)
+
+iter_profiles(nn, minutes, chunk_size, seed, perturb, out, **kwargs)
+
 
 # TODO: Add unit tests?
 '''
 
+import os
 import numpy as np
 import random
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
 
 def ff(
     xx,
@@ -95,8 +119,8 @@ def ff(
     
     With numpy vectors AA, BB, CC being parameters of equal length
     
-    :param xx: Input value
-    :type xx: float
+    :param xx: Input value, or an array of input values
+    :type xx: float or np.array
     :param AA: Amplitude
     :type AA: np.array
     :param BB: Frequency, in (1/day). (Note that 0..1440 maps to 0..2\pi)
@@ -104,13 +128,64 @@ def ff(
     :param CC: Offset, in minutes. 
     :type CC: np.array
     
-    :returns: Sum of sine-waves according to params AA, BB, CC
-    :rtype: float
+    :returns: Sum of sine-waves according to params AA, BB, CC,
+        with the same shape as xx
+    :rtype: float or np.array
     '''
+    # trailing axis so an array of minutes broadcasts against AA, BB, CC
+    xx = np.asarray(xx)[..., np.newaxis]
     # convert xx from minutes to rads
     input_as_rads = (BB * xx + CC) * 2 * np.pi / 1440
     # (sin(...)+1)/2 to normalize from [-1,1] to [0,1]
-    return sum(AA*(np.sin(input_as_rads)+1)/2)
+    return np.sum(AA*(np.sin(input_as_rads)+1)/2, axis=-1)
+
+
+def ff_batch(xx, AA, BB, CC, out = None):
+    '''Evaluate ff for many profiles over many minutes in one pass.
+    
+    Row ii of AA, BB, CC holds the parameters of profile ii, e.g. as
+    produced by `stack_params`. 1-D parameters are treated as one profile.
+    xx is either shared by all profiles, or has one row per profile.
+    
+    The loop runs over the (few) sine terms, not over profiles or minutes,
+    so the work is a handful of array operations on an (nn, mm) buffer.
+    
+    :param xx: Input values, e.g. np.arange(1440)
+    :type xx: np.array of shape (mm,) or (nn, mm)
+    :param AA: Amplitudes
+    :type AA: np.array of shape (nn, kk)
+    :param BB: Frequencies, in (1/day)
+    :type BB: np.array of shape (nn, kk)
+    :param CC: Offsets, in minutes
+    :type CC: np.array of shape (nn, kk)
+    :param out: Array to write the result into, defaults to a new array
+    :type out: np.array of shape (nn, mm), optional
+    
+    :returns: out[ii, jj] == ff(xx[jj], AA[ii], BB[ii], CC[ii])
+        (or ff(xx[ii, jj], ...) if xx has one row per profile)
+    :rtype: np.array of shape (nn, mm)
+    '''
+    xx = np.asarray(xx, dtype=np.float64)
+    if xx.ndim != 2:
+        xx = xx.ravel()
+    AA = np.atleast_2d(np.asarray(AA, dtype=np.float64))
+    BB = np.atleast_2d(np.asarray(BB, dtype=np.float64))
+    CC = np.atleast_2d(np.asarray(CC, dtype=np.float64))
+    
+    # sum(AA*(sin+1)/2) == sum(AA)/2 + sum(AA/2 * sin)
+    if out is None:
+        out = np.empty((AA.shape[0], xx.shape[-1]))
+    out[:] = AA.sum(axis=1)[:, np.newaxis] / 2
+    tmp = np.empty_like(out)
+    for kk in range(AA.shape[1]):
+        np.multiply(BB[:, kk, np.newaxis], xx, out=tmp)
+        tmp += CC[:, kk, np.newaxis]
+        tmp *= 2 * np.pi / 1440
+        np.sin(tmp, out=tmp)
+        tmp *= AA[:, kk, np.newaxis] / 2
+        out += tmp
+    
+    return out
 
 @dataclass
 class Params:
@@ -118,26 +193,99 @@ class Params:
     
     See ff docstring for more details
     '''
-    AA: np.array = np.array([4,2,1])
-    BB: np.array = np.array([1,2,4])
-    CC: np.array = np.array([-180, 0, -180])
+    AA: np.array = field(default_factory=lambda: np.array([4,2,1]))
+    BB: np.array = field(default_factory=lambda: np.array([1,2,4]))
+    CC: np.array = field(default_factory=lambda: np.array([-180, 0, -180]))
 
     
+def get_rng(rng = None):
+    '''Resolve the `rng` argument accepted by the functions here.
+    
+    :param rng: None for the global np.random state (the default everywhere),
+        or a np.random.Generator, or a np.random.SeedSequence / int seed to
+        build a new Generator from
+    :type rng: None | np.random.Generator | np.random.SeedSequence | int
+    
+    :returns: An object with a np.random-style `.normal(...)`
+    :rtype: np.random.Generator or the np.random module
+    '''
+    if rng is None:
+        return np.random
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def profile_rngs(seed, start, stop):
+    '''One independent, counter-based Generator per profile index.
+    
+    The stream for profile ii depends only on (seed, ii), so profile ii is
+    bit-identical whichever worker generates it and however the range
+    [0, nn) is split up between workers.
+    
+    Example usage, in a worker responsible for profiles start..stop:
+    
+    rngs = profile_rngs(seed, start, stop)
+    bank = ProfileBank.generate(stop - start, rng = rngs)
+    day = bank.evaluate(np.arange(1440), perturb = True, rng = rngs)
+    
+    :param seed: Root seed shared by all workers
+    :type seed: int or np.random.SeedSequence
+    :param start: First profile index, inclusive
+    :type start: int
+    :param stop: Last profile index, exclusive
+    :type stop: int
+    
+    :returns: Generators for profiles start, ..., stop - 1
+    :rtype: list of np.random.Generator
+    '''
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [
+        np.random.Generator(np.random.Philox(np.random.SeedSequence(
+            seed.entropy, spawn_key = seed.spawn_key + (ii,)
+        )))
+        for ii in range(start, stop)
+    ]
+
+
 def generate_parameters(
     AA = np.array([4,2,1]),
     BB = np.array([1,2,4]),
-    CC = np.array([-180 % 1440, 0, -180 % 1440])
+    CC = np.array([-180 % 1440, 0, -180 % 1440]),
+    rng = None,
 ):
     '''
     Generate parameters used to instantiate "base" functions.
     I.e. a new instance of 'Params`.
     
-    See `ff` and `Params` docstrings for more details.
+    See `ff` and `Params` docstrings for more details,
+    and `get_rng` for the accepted values of `rng`.
+    '''
+    rng = get_rng(rng)
+    return Params(
+        AA = AA + rng.normal(scale=(AA/4), size=AA.shape),
+        BB = BB,# + rng.normal(scale=(BB/4), size=BB.shape),
+        CC = CC + rng.normal(scale=120, size=CC.shape)
+    )
+
+
+def stack_params(params):
+    '''Stack a sequence of `Params` into one `Params` of 2-D arrays.
+    
+    Row ii of the result's AA, BB, CC comes from params[ii], which is the
+    layout `ff_batch` expects.
+    
+    :param params: Instances of Params, all with the same number of terms
+    :type params: list of Params
+    
+    :returns: Params with AA, BB, CC of shape (len(params), kk)
+    :rtype: Params
     '''
     return Params(
-        AA = AA + np.random.normal(scale=(AA/4), size=AA.shape),
-        BB = BB,# + np.random.normal(scale=(BB/4), size=BB.shape),
-        CC = CC + np.random.normal(scale=120, size=CC.shape)
+        AA = np.stack([np.asarray(p.AA, dtype=np.float64) for p in params]),
+        BB = np.stack([np.asarray(p.BB, dtype=np.float64) for p in params]),
+        CC = np.stack([np.asarray(p.CC, dtype=np.float64) for p in params]),
     )
 
 
@@ -145,6 +293,7 @@ def ff_with_params(ff, params):
     '''Provides an instance of ff instantiated with params.
     
     Higher-order function that returns another function.
+    If ff accepts arrays (as `ff` does), so does the returned function.
     
     :param ff:
     :type ff: function
@@ -159,18 +308,20 @@ def ff_with_params(ff, params):
     return _ff
 
 
-def p_hv(xx, scale = 1/16):
+def p_hv(xx, scale = 1/16, rng = None):
     '''A simple "perturbation function" that adds noise to values.
     
     :param xx: Value to add noise to
     :type xx: Float or numpy.array
     :param scale: The standard deviation of noise to apply 
     :type scale: Float or numpy.array with length of xx
+    :param rng: Source of noise, see `get_rng`. Defaults to np.random
+    :type rng: np.random.Generator, optional
     
     :returns: 
     :rtype: 
     '''
-    return xx + np.random.normal(scale = scale)
+    return xx + get_rng(rng).normal(scale = scale)
 
 def pp(ff, p_h = p_hv, p_v = p_hv):
     '''
@@ -190,6 +341,338 @@ def pp(ff, p_h = p_hv, p_v = p_hv):
     return __new_ff
 
 
+def _normal_rows(rng, nn, scale = 1.0, size = ()):
+    '''nn rows of normal noise of shape `size`.
+    
+    If rng is a list of Generators, row ii is drawn from rng[ii].
+    '''
+    if isinstance(rng, (list, tuple)):
+        if len(rng) != nn:
+            raise ValueError(f"Expected {nn} generators, got {len(rng)}")
+        return np.stack([r.normal(scale=scale, size=size) for r in rng])
+    return get_rng(rng).normal(scale=scale, size=(nn,) + tuple(size))
+
+
+@dataclass
+class ProfileBank:
+    '''Columnar store of many randomly-instantiated, perturbed profiles.
+    
+    Equivalent to the lists of closures returned by `_get_noise_profiles`,
+    but every parameter lives in a contiguous float64 array, so a bank can
+    be evaluated all at once, sliced, pickled and saved to disk.
+    
+    Profile ii is pp(ff_with_params(ff, bank.params(ii)), p_h, p_v), where
+    p_h and p_v are p_hv with scales h_scale[ii] and v_scale[ii].
+    
+    Example usage:
+    
+    bank = ProfileBank.generate(100000)
+    day = bank.evaluate(np.arange(1440), perturb=True)  # shape (100000, 1440)
+    bank[:10].save('some_bank')
+    same_bank = ProfileBank.load('some_bank', mmap_mode='r')
+    '''
+    AA: np.array
+    BB: np.array
+    CC: np.array
+    h_scale: np.array
+    v_scale: np.array
+    
+    FIELDS = ('AA', 'BB', 'CC', 'h_scale', 'v_scale')
+    
+    def __post_init__(self):
+        for name in ('AA', 'BB', 'CC'):
+            setattr(self, name, np.ascontiguousarray(
+                np.atleast_2d(getattr(self, name)), dtype=np.float64
+            ))
+        nn = self.AA.shape[0]
+        for name in ('h_scale', 'v_scale'):
+            # a scalar scale is shared by every profile
+            setattr(self, name, np.ascontiguousarray(
+                np.broadcast_to(getattr(self, name), (nn,)), dtype=np.float64
+            ))
+    
+    @classmethod
+    def generate(
+        cls,
+        nn,
+        AA = np.array([2/3, 1/6, 1/12, 1/24, 1/24]),
+        BB = np.array([1, 2, 4, 6, 8]),
+        CC = np.array([-240, 300, -180, 0, 30]),
+        h_scale = 12,
+        v_scale = 1/128,
+        rng = None,
+    ):
+        '''Generate nn profiles, as `generate_parameters` would nn times.
+        
+        Defaults match `_get_noise_profiles`.
+        
+        :param nn: The number of profiles to generate
+        :type nn: int
+        :param AA, BB, CC: Base parameters for ff, each of length kk
+        :type AA, BB, CC: np.array
+        :param h_scale: Standard deviation of noise on the input (minutes)
+        :type h_scale: float or np.array of length nn
+        :param v_scale: Standard deviation of noise on the output
+        :type v_scale: float or np.array of length nn
+        :param rng: Source of noise, see `get_rng`, or a list of nn
+            Generators (e.g. from `profile_rngs`) to draw each profile
+            from its own stream, defaults to np.random
+        :type rng: np.random.Generator or list, optional
+        
+        :returns: A bank of nn profiles
+        :rtype: ProfileBank
+        '''
+        AA = np.asarray(AA, dtype=np.float64)
+        BB = np.asarray(BB, dtype=np.float64)
+        CC = np.asarray(CC, dtype=np.float64)
+        size = (nn,) + AA.shape
+        return cls(
+            AA = AA + _normal_rows(rng, nn, scale=(AA/4), size=AA.shape),
+            BB = np.broadcast_to(BB, size),
+            CC = CC + _normal_rows(rng, nn, scale=120, size=CC.shape),
+            h_scale = h_scale,
+            v_scale = v_scale,
+        )
+    
+    def __len__(self):
+        return self.AA.shape[0]
+    
+    def __getitem__(self, idx):
+        '''Select profiles by int, slice or index array.
+        
+        Slices with step 1 are views, so slicing a memory-mapped bank does
+        not read it into memory.
+        '''
+        if isinstance(idx, (int, np.integer)):
+            # raises IndexError if out of range, and makes idx non-negative
+            idx = range(len(self))[idx]
+            idx = slice(idx, idx + 1)
+        return ProfileBank(**{name: getattr(self, name)[idx] for name in self.FIELDS})
+    
+    def params(self, ii):
+        '''The parameters of profile ii, as a `Params`.'''
+        return Params(AA = self.AA[ii], BB = self.BB[ii], CC = self.CC[ii])
+    
+    def evaluate(self, xx, perturb = False, rng = None, out = None):
+        '''Evaluate every profile at every input value.
+        
+        :param xx: Input values, e.g. np.arange(1440)
+        :type xx: np.array of shape (mm,)
+        :param perturb: If True, add noise p_v(ff(p_h(xx))) to each value,
+            as the `pp`-wrapped functions do, defaults to False
+        :type perturb: bool, optional
+        :param rng: Source of noise, as in `generate`, defaults to np.random
+        :type rng: np.random.Generator or list, optional
+        :param out: Array to write the result into, defaults to a new array
+        :type out: np.array of shape (len(self), mm), optional
+        
+        :returns: out[ii, jj] is profile ii evaluated at xx[jj]
+        :rtype: np.array of shape (len(self), mm)
+        '''
+        xx = np.asarray(xx, dtype=np.float64).ravel()
+        if not perturb:
+            return ff_batch(xx, self.AA, self.BB, self.CC, out=out)
+        
+        nn, size = len(self), xx.shape
+        xx = xx + _normal_rows(rng, nn, size=size) * self.h_scale[:, np.newaxis]
+        out = ff_batch(xx, self.AA, self.BB, self.CC, out=out)
+        out += _normal_rows(rng, nn, size=size) * self.v_scale[:, np.newaxis]
+        return out
+    
+    def save(self, path):
+        '''Save the bank as one .npy file per field in directory `path`.'''
+        os.makedirs(path, exist_ok=True)
+        for name in self.FIELDS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+    
+    @classmethod
+    def load(cls, path, mmap_mode = None):
+        '''Load a bank saved with `save`.
+        
+        :param path: Directory passed to `save`
+        :type path: str
+        :param mmap_mode: Passed to np.load, e.g. 'r' to memory-map the
+            arrays instead of reading them, defaults to None
+        :type mmap_mode: str, optional
+        
+        :rtype: ProfileBank
+        '''
+        return cls(**{
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+            for name in cls.FIELDS
+        })
+
+
+def _chunk_kwargs(kwargs, start, stop):
+    '''The `ProfileBank.generate` kwargs for profiles start..stop.
+    
+    Per-profile arrays (h_scale, v_scale of length nn) are sliced to the
+    chunk; everything else, such as the per-term AA, BB, CC, is shared.
+    '''
+    chunk = dict(kwargs)
+    for name in ('h_scale', 'v_scale'):
+        if name in chunk and np.ndim(chunk[name]) > 0:
+            values = np.asarray(chunk[name])
+            if len(values) < stop:
+                raise ValueError(
+                    f"{name} has {len(values)} values, but needs one per profile"
+                )
+            chunk[name] = values[start:stop]
+    return chunk
+
+
+def _synthesize_chunk(shm_name, shape, start, stop, minutes, seed, perturb, kwargs):
+    '''Worker for `synthesize_profiles`: fill rows start..stop in place.'''
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        profiles = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        rngs = profile_rngs(seed, start, stop)
+        bank = ProfileBank.generate(stop - start, rng=rngs, **_chunk_kwargs(kwargs, start, stop))
+        bank.evaluate(minutes, perturb=perturb, rng=rngs, out=profiles[start:stop])
+        del profiles
+    finally:
+        shm.close()
+
+
+def synthesize_profiles(
+    nn,
+    minutes = np.arange(1440),
+    workers = None,
+    seed = None,
+    chunk_size = 4096,
+    perturb = True,
+    **kwargs
+):
+    '''Generate and evaluate nn profiles across a pool of processes.
+    
+    Each worker generates a chunk of profiles (see `ProfileBank.generate`)
+    and writes their values straight into one shared-memory block, so
+    nothing is pickled back to this process. Profile ii is drawn from
+    `profile_rngs(seed, ii, ii+1)`, so for a fixed seed the result does not
+    depend on `workers` or `chunk_size`.
+    
+    The returned array is a view of the shared memory, which has already
+    been unlinked. Keep the returned `shm` alive while using the array,
+    and call `shm.close()` once done with it.
+    
+    When using the default "spawn"/"forkserver" start methods, call this
+    from under `if __name__ == '__main__':`.
+    
+    Example usage:
+    
+    profiles, shm = synthesize_profiles(1000000, workers=8, seed=1234)
+    np.save('profiles.npy', profiles)
+    del profiles
+    shm.close()
+    
+    :param nn: The number of profiles to generate
+    :type nn: int
+    :param minutes: Input values, defaults to np.arange(1440)
+    :type minutes: np.array of shape (mm,)
+    :param workers: Number of worker processes, defaults to os.cpu_count()
+    :type workers: int, optional
+    :param seed: Root seed for `profile_rngs`, defaults to fresh entropy
+    :type seed: int or np.random.SeedSequence, optional
+    :param chunk_size: Profiles per task, which bounds per-worker memory
+    :type chunk_size: int, optional
+    :param perturb: Passed to `ProfileBank.evaluate`, defaults to True
+    :type perturb: bool, optional
+    :param kwargs: Passed to `ProfileBank.generate`, e.g. AA, BB, CC.
+        h_scale and v_scale may be arrays of length nn, one per profile.
+    
+    :returns: The (nn, mm) array of profile values, and its shared memory
+    :rtype: tuple of (np.array, multiprocessing.shared_memory.SharedMemory)
+    '''
+    minutes = np.asarray(minutes, dtype=np.float64).ravel()
+    if seed is None:
+        seed = np.random.SeedSequence()
+    shape = (nn, minutes.shape[0])
+    
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(1, nn * minutes.shape[0] * 8)
+    )
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _synthesize_chunk, shm.name, shape,
+                    start, min(start + chunk_size, nn),
+                    minutes, seed, perturb, kwargs
+                )
+                for start in range(0, nn, chunk_size)
+            ]
+            for future in futures:
+                # re-raise any exception from the worker
+                future.result()
+    except BaseException:
+        shm.close()
+        raise
+    finally:
+        shm.unlink()
+    
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf), shm
+
+
+def iter_profiles(
+    nn = None,
+    minutes = np.arange(1440),
+    chunk_size = 1024,
+    seed = None,
+    perturb = True,
+    out = None,
+    **kwargs
+):
+    '''Yield perturbed profiles in (chunk_size, mm) blocks.
+    
+    Only one chunk is held in memory at a time, so the profiles can be
+    streamed to disk or a socket without materializing all of them.
+    
+    If `out` is given, every block is a view into it and is overwritten by
+    the next one, so consume (or copy) each block before advancing.
+    
+    With a seed, profile ii is drawn from `profile_rngs(seed, ii, ii+1)`,
+    so the stream matches `synthesize_profiles` with the same seed.
+    
+    Example usage:
+    
+    with open('profiles.bin', 'wb') as ff_out:
+        for block in iter_profiles(1000000, seed=1234):
+            ff_out.write(block)
+    
+    :param nn: Total number of profiles, defaults to an endless stream
+    :type nn: int, optional
+    :param minutes: Input values, defaults to np.arange(1440)
+    :type minutes: np.array of shape (mm,)
+    :param chunk_size: Profiles per block; the last block may be shorter
+    :type chunk_size: int, optional
+    :param seed: Root seed for `profile_rngs`, defaults to np.random
+    :type seed: int or np.random.SeedSequence, optional
+    :param perturb: Passed to `ProfileBank.evaluate`, defaults to True
+    :type perturb: bool, optional
+    :param out: Buffer to reuse for every block, defaults to a new array
+        per block
+    :type out: np.array of shape (chunk_size, mm), optional
+    :param kwargs: Passed to `ProfileBank.generate`, e.g. AA, BB, CC.
+        h_scale and v_scale may be arrays of length nn, one per profile.
+    
+    :yields: np.array of shape (<= chunk_size, mm)
+    '''
+    minutes = np.asarray(minutes, dtype=np.float64).ravel()
+    if out is not None and out.shape != (chunk_size, minutes.shape[0]):
+        raise ValueError(
+            f"out has shape {out.shape}, expected {(chunk_size, minutes.shape[0])}"
+        )
+    
+    start = 0
+    while nn is None or start < nn:
+        stop = start + chunk_size if nn is None else min(start + chunk_size, nn)
+        rng = None if seed is None else profile_rngs(seed, start, stop)
+        bank = ProfileBank.generate(stop - start, rng=rng, **_chunk_kwargs(kwargs, start, stop))
+        block = None if out is None else out[:stop - start]
+        yield bank.evaluate(minutes, perturb=perturb, rng=rng, out=block)
+        start = stop
+
+
 # example
 def _get_noise_profiles(
     ff = ff,
@@ -212,6 +695,8 @@ def _get_noise_profiles(
     2. base_ffs: List of functions with randomly-instantiated parameters
     3. pert_ffs: List of functions with randomly-instantiated parameters
                  AND noise p_v(f(p_h(x))) added on top.
+    
+    For more than a handful of profiles, see `ProfileBank.generate`.
     '''
     
     basic_ff = lambda xx: ff(xx, AA, BB, CC)
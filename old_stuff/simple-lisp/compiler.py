@@ -0,0 +1,301 @@
+import functools
+import math
+import operator
+
+import numpy as np
+
+from parser import parse, LIST, INT, FLOAT, NAME
+
+# Opcodes. Every instruction is an (opcode, argument) pair:
+#   CONST ii    push consts[ii]
+#   LOAD ii     push the value bound to names[ii]
+#   ADD nn      pop nn values, push their sum; likewise MUL, SUB and DIV,
+#               which fold from the left: (- a b c) is a - b - c
+#   NEG 0       negate the top of the stack: (- a)
+#   INV 0       replace the top of the stack x with 1 / x: (/ a)
+CONST, LOAD, ADD, SUB, MUL, DIV, NEG, INV = range(8)
+
+OPERATORS = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+
+
+def _fold(op, values):
+    # What op does to a list of (at least one) values
+    if op == ADD:
+        return sum(values[1:], values[0])
+    if op == MUL:
+        return math.prod(values[1:], start=values[0])
+    if op == SUB:
+        return functools.reduce(operator.sub, values)
+    return functools.reduce(operator.truediv, values)
+
+
+class Program:
+    """
+    A compiled expression: bytecode, plus the constants and names it uses
+    
+    Call it with the values of its free symbols as keywords:
+    
+        >>> compile_expression('(+ (* a 2) b)')(a=3, b=1)
+        7
+    """
+    
+    def __init__(self, code, consts, names, source=None):
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.source = source
+    
+    def __repr__(self):
+        return f'Program({self.source!r})'
+    
+    def __call__(self, **env):
+        return run(self, env)
+
+
+def run(program, env):
+    """
+    Execute program on a stack, with its free symbols bound by the env dict
+    """
+    code = program.code
+    if len(code) == 1 and code[0][0] == CONST:
+        # folded all the way down
+        return program.consts[code[0][1]]
+    
+    consts = program.consts
+    values = [env[name] for name in program.names]
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    
+    for op, arg in code:
+        if op == CONST:
+            push(consts[arg])
+        elif op == LOAD:
+            push(values[arg])
+        elif arg == 2:
+            # binary operations are the common case. (Not with +=, which
+            # would modify arrays passed in env.)
+            right = pop()
+            if op == ADD:
+                stack[-1] = stack[-1] + right
+            elif op == MUL:
+                stack[-1] = stack[-1] * right
+            elif op == SUB:
+                stack[-1] = stack[-1] - right
+            else:
+                stack[-1] = stack[-1] / right
+        elif op == NEG:
+            stack[-1] = -stack[-1]
+        elif op == INV:
+            stack[-1] = 1 / stack[-1]
+        else:
+            args = stack[-arg:]
+            del stack[-arg:]
+            push(_fold(op, args))
+    
+    return stack[0]
+
+
+_UFUNCS = {ADD: np.add, SUB: np.subtract, MUL: np.multiply, DIV: np.true_divide}
+
+
+def run_columns(program, columns, out=None, chunk_size=1 << 16):
+    """
+    Execute program over whole NumPy arrays, bound to its free symbols
+    
+    Each instruction is one ufunc call over a block of rows, e.g.
+    run_columns(compile_expression('(+ (* a 2) b)'), {'a': aa, 'b': bb}).
+    Intermediate results go to one preallocated temporary per stack level,
+    reused by every instruction at that level and for every block, so no
+    arrays are allocated per node. Blocks of chunk_size rows keep those
+    temporaries in cache.
+    
+    :param columns: dict of symbol name to array (or scalar). Arrays are
+        broadcast together, as by NumPy.
+    :param out: Array for the result, or None to allocate one. Its dtype is
+        float64 if the program divides, else the dtype of the operands. If
+        it overlaps an input, the result is computed into a copy first.
+    :return: out
+    """
+    code, consts = program.code, program.consts
+    values = [np.asarray(columns[name]) for name in program.names]
+    shape = np.broadcast_shapes(*(value.shape for value in values))
+    if out is not None and any(np.may_share_memory(out, value) for value in values):
+        # Results are written to out while later operands are still being
+        # read, so an input overlapping out must not change until the end
+        out[...] = run_columns(program, columns, np.empty_like(out), chunk_size)
+        return out
+    if out is None:
+        divides = any(op in (DIV, INV) for op, __ in code)
+        dtype = np.result_type(*values, *consts, *([np.float64] if divides else []))
+        out = np.empty(shape, dtype=dtype)
+    
+    if len(code) == 1:
+        # folded down to a constant, or just one symbol
+        out[...] = consts[code[0][1]] if code[0][0] == CONST else values[code[0][1]]
+        return out
+    if not shape:
+        out[...] = run(program, dict(zip(program.names, values)))
+        return out
+    
+    # Rows of arrays spanning the whole first axis are split into blocks;
+    # anything broadcast along it is used whole
+    nrows = shape[0]
+    split = [value.ndim == len(shape) and value.shape[0] == nrows for value in values]
+    temps = []
+    
+    for start in range(0, nrows, chunk_size):
+        stop = min(start + chunk_size, nrows)
+        block = [value[start:stop] if whole else value for value, whole in zip(values, split)]
+        target = out[start:stop]
+        stack = []
+        
+        for ii, (op, arg) in enumerate(code):
+            if op == CONST:
+                stack.append(consts[arg])
+                continue
+            if op == LOAD:
+                stack.append(block[arg])
+                continue
+            
+            # The result goes to this stack level's temporary, or straight to
+            # out if this is the last instruction
+            level = len(stack) - (1 if op in (NEG, INV) else arg)
+            if ii == len(code) - 1:
+                dest = target
+            else:
+                while len(temps) <= level:
+                    temps.append(np.empty((min(chunk_size, nrows),) + shape[1:], dtype=out.dtype))
+                dest = temps[level][:stop - start]
+            
+            if op == NEG:
+                np.negative(stack[-1], out=dest)
+            elif op == INV:
+                np.true_divide(1, stack[-1], out=dest)
+            else:
+                ufunc = _UFUNCS[op]
+                operands = stack[-arg:]
+                ufunc(operands[0], operands[1], out=dest)
+                for operand in operands[2:]:
+                    ufunc(dest, operand, out=dest)
+            del stack[level:]
+            stack.append(dest)
+    
+    return out
+
+
+def compile_tree(tree, root=0, source=None):
+    """
+    Compile the expression at node root of a parser.Tree into a Program
+    
+    Subexpressions with only constant operands are computed here, once, and
+    emitted as a single CONST. (Except ones that divide by zero, which are
+    left to raise when run.)
+    """
+    kind, first_child, next_sibling = tree.kind, tree.first_child, tree.next_sibling
+    end = int(next_sibling[root]) if next_sibling[root] != -1 else len(tree)
+    
+    # 1. Check each list, and fold it if its operands are constants. Children
+    # come after their parent, so going backwards folds children first.
+    ops = {}
+    folded = {}
+    for node in range(end - 1, root - 1, -1):
+        if kind[node] in (INT, FLOAT):
+            folded[node] = tree.atom(node)
+        if kind[node] != LIST:
+            continue
+        
+        head = int(first_child[node])
+        if head == -1:
+            raise SyntaxError(f"Empty expression at {tree.start[node]}")
+        if kind[head] != NAME or tree.atom(head) not in OPERATORS:
+            raise SyntaxError(
+                f"Expected one of {' '.join(OPERATORS)} at {tree.start[head]}, "
+                f"not {tree.to_list(head)!r}"
+            )
+        op = OPERATORS[tree.atom(head)]
+        operands = list(tree.siblings(int(next_sibling[head])))
+        if not operands and op in (SUB, DIV):
+            raise SyntaxError(f"{tree.atom(head)} needs an operand, at {tree.start[node]}")
+        ops[node] = op, operands
+        
+        if all(operand in folded for operand in operands):
+            values = [folded[operand] for operand in operands]
+            try:
+                if not values:
+                    folded[node] = 0 if op == ADD else 1
+                elif len(values) == 1 and op == SUB:
+                    folded[node] = -values[0]
+                elif len(values) == 1 and op == DIV:
+                    folded[node] = 1 / values[0]
+                else:
+                    folded[node] = _fold(op, values)
+            except ZeroDivisionError:
+                pass
+    
+    # 2. Emit the code, operands before operators
+    code, consts, names = [], [], []
+    const_index, name_index = {}, {}
+    todo = [(root, False)]
+    while todo:
+        node, operands_done = todo.pop()
+        if node in folded:
+            value = folded[node]
+            # keyed on the type too, so that 1 and 1.0 stay distinct
+            key = (type(value), value)
+            if key not in const_index:
+                const_index[key] = len(consts)
+                consts.append(value)
+            code.append((CONST, const_index[key]))
+        elif kind[node] == NAME:
+            name = tree.atom(node)
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+            code.append((LOAD, name_index[name]))
+        elif not operands_done:
+            todo.append((node, True))
+            todo.extend((operand, False) for operand in reversed(ops[node][1]))
+        else:
+            op, operands = ops[node]
+            if not operands:
+                # (+ x) can't reach here, but (+) and (*) can if not folded
+                code.append((CONST, len(consts)))
+                consts.append(0 if op == ADD else 1)
+            elif len(operands) == 1:
+                if op == SUB:
+                    code.append((NEG, 0))
+                elif op == DIV:
+                    code.append((INV, 0))
+            else:
+                code.append((op, len(operands)))
+    
+    return Program(code, consts, names, source)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(source):
+    """
+    Compile the one expression in source to a Program, cached on source
+    
+    Repeated expressions are only tokenized, parsed and compiled once.
+    """
+    tree = parse(source)
+    roots = list(tree.roots())
+    if len(roots) != 1:
+        raise SyntaxError(f"Expected one expression, found {len(roots)}")
+    return compile_tree(tree, roots[0], source)
+
+
+def evaluate(source, **env):
+    """
+    Evaluate the expression in source, e.g. evaluate('(+ x 1)', x=2)
+    """
+    return run(compile_expression(source), env)
+
+
+def evaluate_columns(source, columns, out=None):
+    """
+    Evaluate the expression in source over arrays, see run_columns
+    """
+    return run_columns(compile_expression(source), columns, out)
@@ -0,0 +1,308 @@
+"""
+Randomized and adversarial s-expression corpora, for testing and benchmarks.
+
+Every case is generated as a list of tokens and an arithmetic value worked
+out alongside it, then rendered to source text with some whitespace. So the
+expected outputs never come from the code under test. The kinds of case:
+
+ * `example`:    the hand-written cases from tests.py, with their expected
+                 tokens and values written out by hand too
+ * `random`:     random arithmetic expressions
+ * `deep`:       deeply nested expressions
+ * `long`:       ints with up to 18 digits, and floats longer than 64 characters
+ * `whitespace`: tabs, newlines and runs of spaces everywhere
+ * `symbols`:    expressions that tokenize and parse, but don't evaluate
+
+Cases are stored as CSV with columns kind, source, tokens (space-separated),
+and value: an int or float literal, "ZeroDivisionError", or empty if the
+case should not evaluate.
+
+Usage:
+    python corpus.py generate [--cases 250] [--seed 0] [--out test_cases.csv]
+    python corpus.py check [--path test_cases.csv]
+    python corpus.py bench [--megabytes 4] [--json results.json]
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import sys
+import time
+
+from tokenizer import tokenize, tokenizer, token_spans, span_arrays
+from parser import parse
+from compiler import compile_expression, run
+
+PATH = 'test_cases.csv'
+FIELDS = ('kind', 'source', 'tokens', 'value')
+OPERATORS = '+-*/'
+
+# The hand-written cases from tests.py: (source, tokens, value)
+EXAMPLES = [
+    ('(+ 3 2)', '( + 3 2 )', 3 + 2),
+    ('(/ 100 314)', '( / 100 314 )', 100 / 314),
+    ('(/ -3 2)', '( / -3 2 )', -3 / 2),
+    ('(* 1 2 3 4 5)', '( * 1 2 3 4 5 )', 1 * 2 * 3 * 4 * 5),
+    ('(* (+ 1 (/ 10 2) 3) (* 4 3))', '( * ( + 1 ( / 10 2 ) 3 ) ( * 4 3 ) )',
+     (1 + 10 / 2 + 3) * (4 * 3)),
+    ('   ( -   10   3    )', '( - 10 3 )', 10 - 3),
+    ('(hey whats up)', '( hey whats up )', None),
+    ('(+ 3 1.2)', '( + 3 1.2 )', 3 + 1.2),
+    ('(hey (+ 300 (* 4    -20.5 10)))', '( hey ( + 300 ( * 4 -20.5 10 ) ) )', None),
+]
+
+
+def _apply(op, values):
+    # What the compiler does with op, on Python numbers
+    if op == '+':
+        return sum(values[1:], values[0]) if values else 0
+    if op == '*':
+        return math.prod(values[1:], start=values[0]) if values else 1
+    if len(values) == 1:
+        return -values[0] if op == '-' else 1 / values[0]
+    result = values[0]
+    for value in values[1:]:
+        result = result - value if op == '-' else result / value
+    return result
+
+
+def _number(rng, digits=4):
+    # (text, value) of a random int or float literal
+    sign = rng.choice(['', '', '-', '+'])
+    whole = str(rng.randrange(10 ** rng.randint(1, digits)))
+    style = rng.randrange(4)
+    if style < 2:
+        text = sign + whole
+        return text, int(text)
+    if style == 2:
+        text = sign + whole + '.' + str(rng.randrange(10 ** rng.randint(1, digits)))
+    else:
+        text = sign + rng.choice(['.5', whole + '.', whole + 'e' + str(rng.randint(-5, 5))])
+    return text, float(text)
+
+
+def _expression(rng, depth, digits=4):
+    # (tokens, value) of a random arithmetic expression
+    if depth == 0 or rng.random() < 0.3:
+        text, value = _number(rng, digits)
+        return [text], value
+    op = rng.choice(OPERATORS)
+    nargs = rng.randint(1 if op in '-/' else 0, 4)
+    tokens = ['(', op]
+    values = []
+    for __ in range(nargs):
+        sub_tokens, sub_value = _expression(rng, depth - 1, digits)
+        tokens += sub_tokens
+        values.append(sub_value)
+    tokens.append(')')
+    if any(value is None for value in values):
+        # something below divides by zero
+        return tokens, None
+    try:
+        return tokens, _apply(op, values)
+    except ZeroDivisionError:
+        return tokens, None
+
+
+def _render(rng, tokens, storm=False):
+    # tokens as source text, with the least whitespace needed, or lots of it
+    spaces = [' \t\n', '\r\n', '  ', '\t\t', '\n'] if storm else [' ']
+    parts = []
+    for ii, token in enumerate(tokens):
+        needed = ii and token not in '()' and tokens[ii - 1] not in '()'
+        if storm or needed:
+            parts.append(''.join(rng.choice(spaces) for __ in range(rng.randint(needed, 3))))
+        parts.append(token)
+    if storm:
+        parts.append(rng.choice(spaces))
+    return ''.join(parts)
+
+
+def _row(kind, source, tokens, value):
+    if value is None:
+        value = ''
+    elif value == 'error':
+        value = 'ZeroDivisionError'
+    else:
+        value = repr(value)
+    return {'kind': kind, 'source': source, 'tokens': ' '.join(tokens), 'value': value}
+
+
+def generate(cases=250, seed=0, max_depth=1000):
+    """Generate a list of cases (dicts of FIELDS), always the same for a seed"""
+    rng = random.Random(seed)
+    rows = []
+    for source, tokens, value in EXAMPLES:
+        rows.append(_row('example', source, tokens.split(' '), value))
+    
+    kinds = ['random', 'deep', 'long', 'whitespace', 'symbols']
+    for ii in range(cases - len(rows)):
+        kind = kinds[ii % len(kinds)]
+        if kind == 'deep':
+            depth = rng.randint(50, max_depth)
+            op = rng.choice('+*')
+            tokens = ['(', op, '1'] * depth + ['1'] + [')'] * depth
+            rows.append(_row(kind, _render(rng, tokens), tokens, depth + 1 if op == '+' else 1))
+            continue
+        if kind == 'symbols':
+            names = ['hey', 'whats', 'up', 'x', 'long-name?', '+', '-', '+x', 'a.b', '->']
+            tokens = ['(']
+            for __ in range(rng.randint(1, 8)):
+                if rng.random() < 0.2:
+                    tokens += ['(', rng.choice(names), ')']
+                else:
+                    tokens.append(rng.choice(names))
+            tokens.append(')')
+            rows.append(_row(kind, _render(rng, tokens), tokens, None))
+            continue
+        
+        digits = 18 if kind == 'long' else 4
+        tokens, value = _expression(rng, rng.randint(1, 6), digits)
+        if kind == 'long':
+            # a float literal past the fast path's longest token, too
+            text = '0.' + ''.join(rng.choice('0123456789') for __ in range(rng.randint(60, 200)))
+            tokens = ['(', '+', text] + tokens + [')']
+            value = None if value is None else float(text) + value
+        if value is None:
+            value = 'error'
+        rows.append(_row(kind, _render(rng, tokens, storm=(kind == 'whitespace')), tokens, value))
+    return rows
+
+
+def write_cases(rows, path=PATH):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_cases(path=PATH):
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def check_case(row):
+    """
+    Check one case against tokenize, tokenizer, parse and evaluate
+    
+    :return: A description of the first mismatch, or None if all is well
+    """
+    source = row['source']
+    expected = row['tokens'].split(' ') if row['tokens'] else []
+    if tokenize(source) != expected:
+        return f"tokenize gave {tokenize(source)}"
+    # tokenizer only splits on spaces, and drops a last token that is not
+    # followed by one or a paren
+    only_spaces = not any(char.isspace() and char != ' ' for char in source)
+    if only_spaces and source.rstrip(' ').endswith(')'):
+        if list(tokenizer(source)) != expected:
+            return f"tokenizer gave {list(tokenizer(source))}"
+    tree = parse(source)
+    if len(tree) != sum(token != ')' for token in expected):
+        return f"parse gave {len(tree)} nodes"
+    
+    if not row['value']:
+        return None
+    try:
+        value = run(compile_expression(source), {})
+    except ZeroDivisionError:
+        value = 'ZeroDivisionError'
+    if row['value'] == 'ZeroDivisionError' or value == 'ZeroDivisionError':
+        return None if value == row['value'] else f"evaluate gave {value!r}"
+    expected_value = float(row['value']) if isinstance(value, float) else int(row['value'])
+    if math.isnan(value) and math.isnan(expected_value):
+        return None
+    if not math.isclose(value, expected_value, rel_tol=1e-9, abs_tol=1e-12):
+        return f"evaluate gave {value!r}, not {row['value']}"
+    return None
+
+
+def bench(megabytes=4, seed=0, repeat=3):
+    """
+    Time the tokenizers on about this many MB of generated source
+    
+    :return: list of dicts of results
+    """
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < megabytes * 1e6:
+        tokens, __ = _expression(rng, 6)
+        parts.append(_render(rng, tokens))
+        size += len(parts[-1]) + 1
+    source = ' '.join(parts) + ' '
+    data = source.encode()
+    ntokens = len(span_arrays(data)[0])
+    
+    contenders = {
+        'tokenizer': lambda: sum(1 for __ in tokenizer(source)),
+        'token_spans': lambda: sum(1 for __ in token_spans(source)),
+        'span_arrays': lambda: span_arrays(data),
+        'parse': lambda: parse(data),
+    }
+    results = []
+    for name, function in contenders.items():
+        best = min(_timed(function) for __ in range(repeat))
+        results.append({
+            'function': name,
+            'megabytes': len(data) / 1e6,
+            'tokens': ntokens,
+            'tokens_per_s': ntokens / best,
+            'mb_per_s': len(data) / best / 1e6,
+        })
+    return results
+
+
+def _timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help="Write a corpus of cases")
+    generate_parser.add_argument('--cases', type=int, default=250)
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.add_argument('--max-depth', type=int, default=1000,
+                                 help="Deepest nesting of the 'deep' cases")
+    generate_parser.add_argument('--out', default=PATH)
+    check_parser = commands.add_parser('check', help="Check every case in a corpus")
+    check_parser.add_argument('--path', default=PATH)
+    bench_parser = commands.add_parser('bench', help="Report tokenizer throughput")
+    bench_parser.add_argument('--megabytes', type=float, default=4)
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.add_argument('--json', metavar='PATH',
+                              help="Also write the results as JSON to PATH ('-' for stdout)")
+    args = parser.parse_args()
+    
+    if args.command == 'generate':
+        rows = generate(args.cases, args.seed, args.max_depth)
+        write_cases(rows, args.out)
+        print(f"Wrote {len(rows)} cases to {args.out}")
+    
+    elif args.command == 'check':
+        rows = read_cases(args.path)
+        failures = 0
+        for number, row in enumerate(rows):
+            problem = check_case(row)
+            if problem:
+                failures += 1
+                print(f"Case {number} ({row['kind']}): {problem}", file=sys.stderr)
+        print(f"{len(rows) - failures} of {len(rows)} cases passed")
+        sys.exit(1 if failures else 0)
+    
+    else:
+        results = bench(args.megabytes, args.seed)
+        print(f"{'function':>12} {'tokens/s':>14} {'MB/s':>8}", file=sys.stderr)
+        for result in results:
+            print(f"{result['function']:>12} {result['tokens_per_s']:>14,.0f} "
+                  f"{result['mb_per_s']:>8.1f}", file=sys.stderr)
+        if args.json == '-':
+            json.dump(results, sys.stdout, indent=2)
+        elif args.json:
+            with open(args.json, 'w') as file:
+                json.dump(results, file, indent=2)
@@ -0,0 +1,258 @@
+import numpy as np
+
+from tokenizer import span_arrays, LPAREN, RPAREN, NUMBER, SYMBOL
+
+# Node kinds
+LIST, INT, FLOAT, NAME = range(4)
+
+
+class Tree:
+    """
+    s-expressions, stored as parallel arrays indexed by node number
+    
+    Nodes are numbered in the order they appear in the source, so node 0 is
+    the first expression, and the first child of a LIST is the node after it.
+    
+    kind[ii]            LIST, INT, FLOAT or NAME
+    value[ii]           LIST: number of children; INT: the integer;
+                        FLOAT: the float's bits (see floats); NAME: its index
+                        in symbols
+    first_child[ii]     first child of a LIST, or -1
+    next_sibling[ii]    next node in the same list, or the next top-level
+                        expression, or -1
+    start[ii]           offset of the node in the source
+    symbols             sorted list of the distinct symbol names
+    """
+    
+    def __init__(self, kind, value, first_child, next_sibling, start, symbols):
+        self.kind = kind
+        self.value = value
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+        self.start = start
+        self.symbols = symbols
+    
+    @property
+    def floats(self):
+        # the FLOAT values, as floats (this is a view, not a copy)
+        return self.value.view(np.float64)
+    
+    def __len__(self):
+        return len(self.kind)
+    
+    def siblings(self, node):
+        # node, and the nodes after it in the same list
+        while node != -1:
+            yield node
+            node = int(self.next_sibling[node])
+    
+    def roots(self):
+        return self.siblings(0 if len(self) else -1)
+    
+    def children(self, node):
+        return self.siblings(int(self.first_child[node]))
+    
+    def atom(self, node):
+        # The Python value of an INT, FLOAT or NAME node
+        kind = self.kind[node]
+        if kind == INT:
+            return int(self.value[node])
+        if kind == FLOAT:
+            return float(self.floats[node])
+        if kind == NAME:
+            return self.symbols[self.value[node]]
+        raise TypeError(f"Node {node} is a list, not an atom")
+    
+    def to_list(self, node=0):
+        # node as nested Python lists, e.g. for testing
+        if self.kind[node] == LIST:
+            return [self.to_list(child) for child in self.children(node)]
+        return self.atom(node)
+
+
+# Longest token converted by the vectorized path of _token_array
+_MAX_WIDTH = 64
+_INT64 = np.iinfo(np.int64)
+
+
+def _bytes_of(source):
+    # source as a uint8 array, if byte offsets are character offsets in it
+    if isinstance(source, str):
+        return np.frombuffer(source.encode('ascii'), dtype=np.uint8) if source.isascii() else None
+    return np.frombuffer(source, dtype=np.uint8)
+
+
+def _token_array(source, data, starts, ends):
+    # The tokens source[starts[ii]:ends[ii]], as one NumPy string array, and
+    # a dict {ii: token} of the ones longer than _MAX_WIDTH, as str. Those
+    # are left empty in the array, so one long token doesn't widen every row.
+    if not len(starts):
+        return np.array([], dtype='S1'), {}
+    if data is None:
+        return np.array([source[start:end] for start, end in zip(starts.tolist(), ends.tolist())]), {}
+    
+    lengths = ends - starts
+    short = lengths <= _MAX_WIDTH
+    longs = {
+        ii: bytes(data[starts[ii]:ends[ii]]).decode()
+        for ii in np.flatnonzero(~short).tolist()
+    }
+    width = int(lengths[short].max()) if short.any() else 1
+    
+    # Gather the bytes of every short token into one zero-padded row each
+    offsets = starts[:, None] + np.arange(width)
+    chars = data[np.minimum(offsets, len(data) - 1)]
+    chars[(offsets >= ends[:, None]) | ~short[:, None]] = 0
+    return chars.view(f'S{width}').ravel(), longs
+
+
+def _unsupported(texts):
+    # Which number tokens have '_' or non-ASCII characters. Python's and
+    # NumPy's parsers accept some of those ('1_0', non-ASCII digits), but
+    # this language does not, however long the token is.
+    if texts.dtype.kind == 'S':
+        bad = np.char.find(texts, b'_') >= 0
+        if len(texts):
+            rows = texts.view(np.uint8).reshape(len(texts), -1)
+            bad |= (rows >= 128).any(axis=1)
+        return bad
+    return np.array([('_' in text) or not text.isascii() for text in texts.tolist()], dtype=bool)
+
+
+def _long_number(text, start):
+    # A number too long for the vectorized path, parsed as that path would
+    if '_' in text or not text.isascii():
+        raise SyntaxError(f"Bad number {text!r} at {start}")
+    if text.lstrip('+-').isdigit():
+        number = int(text)
+        if not _INT64.min <= number <= _INT64.max:
+            raise SyntaxError(f"Bad number {text!r} at {start}")
+        return number
+    try:
+        return float(text)
+    except ValueError:
+        raise SyntaxError(f"Bad number {text!r} at {start}") from None
+
+
+def parse(source):
+    """
+    Parse every expression in source into a Tree
+    
+    source is anything span_arrays takes: str, bytes, bytearray or mmap.
+    The tree is built with whole-array operations on the tokens, so a
+    multi-MB program costs a handful of arrays, not an object per node.
+    Numbers are converted to int64 or float64 once, in bulk, and raise
+    SyntaxError if they do not parse or fit.
+    """
+    starts, ends, kinds = span_arrays(source)
+    opens = kinds == LPAREN
+    closes = kinds == RPAREN
+    
+    # level[tt]: how many lists are open after token tt
+    level = np.cumsum(opens, dtype=np.int64) - np.cumsum(closes, dtype=np.int64)
+    if len(level) and level.min() < 0:
+        bad = int(np.argmax(level < 0))
+        raise SyntaxError(f"Unexpected ')' at {starts[bad]}")
+    if len(level) and level[-1] != 0:
+        raise SyntaxError(f"{level[-1]} unclosed '(' at end of input")
+    
+    # Match parens: sorting them stably by the level inside them leaves each
+    # '(' right before its ')'
+    parens = np.flatnonzero(opens | closes)
+    inside = level[parens] + closes[parens]
+    pairs = parens[np.argsort(inside, kind='stable')].reshape(-1, 2)
+    closing = np.arange(len(kinds), dtype=np.int64)
+    closing[pairs[:, 0]] = pairs[:, 1]
+    
+    # Every token but ')' is a node, numbered in order
+    is_node = ~closes
+    node_of = np.cumsum(is_node, dtype=np.int64) - 1
+    tokens = np.flatnonzero(is_node)
+    nn = len(tokens)
+    node_kinds = kinds[tokens]
+    
+    # The token after a node's subtree is its next sibling, unless it is ')'
+    after = closing[tokens] + 1
+    is_last = after >= len(kinds)
+    after[is_last] = 0
+    next_sibling = np.where(is_last | closes[after], -1, node_of[after])
+    
+    # A list's first child is the next node, unless the list is empty
+    is_list = node_kinds == LPAREN
+    nonempty = is_list & ~closes[np.minimum(tokens + 1, len(kinds) - 1)]
+    first_child = np.where(nonempty, np.arange(1, nn + 1), -1)
+    
+    # Children of a list are the nodes one level deeper, between its parens:
+    # count them by binary search in the nodes sorted by (depth, position)
+    depth = level[tokens] - is_list
+    order_key = depth * len(kinds) + tokens
+    sorted_key = np.sort(order_key)
+    lists = tokens[is_list]
+    inner = (depth[is_list] + 1) * len(kinds)
+    
+    value = np.zeros(nn, dtype=np.int64)
+    value[is_list] = (
+        np.searchsorted(sorted_key, inner + closing[lists])
+        - np.searchsorted(sorted_key, inner + lists)
+    )
+    
+    kind = np.full(nn, LIST, dtype=np.uint8)
+    data = _bytes_of(source)
+    
+    # Symbols: sorted and deduplicated all at once
+    names = np.flatnonzero(node_kinds == SYMBOL)
+    texts, longs = _token_array(source, data, starts[tokens[names]], ends[tokens[names]])
+    short = np.ones(len(names), dtype=bool)
+    short[list(longs)] = False
+    unique, inverse = np.unique(texts[short], return_inverse=True)
+    unique = [
+        symbol.decode() if isinstance(symbol, bytes) else str(symbol)
+        for symbol in unique.tolist()
+    ]
+    symbols = sorted(set(unique).union(longs.values()))
+    if longs:
+        index = {symbol: ii for ii, symbol in enumerate(symbols)}
+        inverse = np.array([index[symbol] for symbol in unique], dtype=np.int64)[inverse]
+        value[names[list(longs)]] = [index[symbol] for symbol in longs.values()]
+    value[names[short]] = inverse
+    kind[names] = NAME
+    
+    # Numbers: ints if they are all digits after the sign, else floats
+    numbers = np.flatnonzero(node_kinds == NUMBER)
+    texts, longs = _token_array(source, data, starts[tokens[numbers]], ends[tokens[numbers]])
+    short = np.ones(len(numbers), dtype=bool)
+    short[list(longs)] = False
+    bad = np.flatnonzero(short & _unsupported(texts))
+    if len(bad):
+        text = texts[bad[0]]
+        if isinstance(text, bytes):
+            text = text.decode()
+        raise SyntaxError(f"Bad number {str(text)!r} at {starts[tokens[numbers[bad[0]]]]}")
+    sign = b'+-' if texts.dtype.kind == 'S' else '+-'
+    is_int = short & np.char.isdigit(np.char.lstrip(texts, sign))
+    is_float = short & ~is_int
+    floats = value.view(np.float64)
+    try:
+        value[numbers[is_int]] = texts[is_int].astype(np.int64)
+        floats[numbers[is_float]] = texts[is_float].astype(np.float64)
+    except (ValueError, OverflowError):
+        for number, text in zip(numbers[short].tolist(), texts[short].tolist()):
+            try:
+                np.array([text]).astype(np.int64 if text.lstrip(sign).isdigit() else np.float64)
+            except (ValueError, OverflowError):
+                if isinstance(text, bytes):
+                    text = text.decode()
+                raise SyntaxError(f"Bad number {text!r} at {starts[tokens[number]]}") from None
+    
+    for ii, text in longs.items():
+        number = _long_number(text, int(starts[tokens[numbers[ii]]]))
+        if isinstance(number, int):
+            value[numbers[ii]] = number
+            is_int[ii] = True
+        else:
+            floats[numbers[ii]] = number
+            is_float[ii] = True
+    kind[numbers[is_int]] = INT
+    kind[numbers[is_float]] = FLOAT
+    
+    return Tree(kind, value, first_child, next_sibling, starts[tokens], symbols)
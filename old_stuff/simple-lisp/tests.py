@@ -1,6 +1,13 @@
+import io
+import mmap
+import os
+import tempfile
 import unittest as ut
 import numpy as np
-from tokenizer import tokenize
+from tokenizer import tokenize, tokenizer, token_spans, LPAREN, RPAREN, NUMBER, SYMBOL
+from parser import parse, LIST, INT, FLOAT, NAME
+from compiler import compile_expression, evaluate, evaluate_columns, run_columns, CONST
+from corpus import check_case, read_cases
 
 class TokenizerTests(ut.TestCase):
     # All tests need to be run in a class
@@ -43,6 +50,184 @@ class TokenizerTests(ut.TestCase):
             ['(', 'hey', '(', '+', '300', '(', '*', '4', '-20.5', '10', ')', ')', ')'])
 
 
+class TokenSpanTests(ut.TestCase):
+    examples = [
+        '(+ 3 2)',
+        '   ( -   10   3    )',
+        '(* (+ 1 (/ 10 2) 3) (* 4 3))',
+        '(hey (+ 300 (* 4    -20.5 10)))',
+    ]
+    
+    def test_spans_match_the_reference_tokenizer(self):
+        for example in self.examples:
+            self.assertEqual(tokenize(example), list(tokenizer(example)))
+    
+    def test_kinds(self):
+        source = '(f -2 1.5e3 - x3 .5 +.5)'
+        kinds = [kind for __, __, kind in token_spans(source)]
+        self.assertEqual(kinds, [LPAREN, SYMBOL, NUMBER, NUMBER, SYMBOL, SYMBOL, NUMBER, NUMBER, RPAREN])
+    
+    def test_non_ascii_matches_the_fast_path(self):
+        self.assertEqual(list(token_spans('(é -.5 +x)')), list(token_spans('(e -.5 +x)')))
+    
+    def test_str_and_bytes_agree_on_non_ascii(self):
+        # only ASCII whitespace splits, and only ASCII digits make numbers,
+        # whether the source is str or bytes
+        for source in ['(a\u00a0b 1)', '(a\x1cb 1)', '(a\x1cb \u00e9)', '(\u0663 x)']:
+            data = source.encode()
+            self.assertEqual(
+                [(source[start:end], kind) for start, end, kind in token_spans(source)],
+                [(data[start:end].decode(), kind) for start, end, kind in token_spans(data)],
+            )
+        self.assertEqual(tokenize('(a\u00a0b)'), ['(', 'a\u00a0b', ')'])
+        self.assertEqual([kind for __, __, kind in token_spans('\u0663')], [SYMBOL])
+    
+    def test_any_whitespace_splits(self):
+        self.assertEqual(tokenize('(+\n\t1\r\n2)'), ['(', '+', '1', '2', ')'])
+    
+    def test_bytes_and_mmap(self):
+        source = ' '.join(self.examples)
+        expected = list(token_spans(source))
+        self.assertEqual(list(token_spans(source.encode())), expected)
+        with tempfile.TemporaryFile() as file:
+            file.write(source.encode())
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(list(token_spans(mapped)), expected)
+    
+    def test_files_across_chunk_boundaries(self):
+        source = ' '.join(self.examples)
+        expected = list(token_spans(source))
+        for chunk_size in (1, 2, 3, 7, 64):
+            self.assertEqual(list(token_spans(io.StringIO(source), chunk_size)), expected)
+            self.assertEqual(list(token_spans(io.BytesIO(source.encode()), chunk_size)), expected)
+
+
+class ParserTests(ut.TestCase):
+    
+    def test_parse_nested(self):
+        tree = parse('(hey (+ 300 (* 4    -20.5 10)))')
+        self.assertEqual(tree.to_list(), ['hey', ['+', 300, ['*', 4, -20.5, 10]]])
+    
+    def test_arrays(self):
+        tree = parse('(+ 1 (f) 2.5 ())')
+        self.assertEqual(tree.kind.tolist(), [LIST, NAME, INT, LIST, NAME, FLOAT, LIST])
+        self.assertEqual(tree.first_child.tolist(), [1, -1, -1, 4, -1, -1, -1])
+        self.assertEqual(tree.next_sibling.tolist(), [-1, 2, 3, 5, -1, 6, -1])
+        self.assertEqual(tree.value[[0, 3, 6]].tolist(), [5, 1, 0])
+        self.assertEqual(tree.floats[5], 2.5)
+        self.assertEqual(tree.symbols, ['+', 'f'])
+    
+    def test_many_expressions(self):
+        tree = parse(b'(a) 7\n(b (c))')
+        self.assertEqual([tree.to_list(root) for root in tree.roots()], [['a'], 7, ['b', ['c']]])
+        self.assertEqual(list(parse('').roots()), [])
+    
+    def test_non_ascii_and_long_tokens(self):
+        long_name = 'x' * 100
+        self.assertEqual(parse('(é 1.5 %s)' % long_name).to_list(), ['é', 1.5, long_name])
+    
+    def test_long_tokens_among_short_ones(self):
+        long_name, long_int, long_float = 'z' * 70, '0' * 70 + '7', '0.' + '5' * 70
+        tree = parse('(b %s a %s 3 %s 2.5 %s)' % (long_name, long_int, long_float, long_name))
+        self.assertEqual(tree.to_list(), ['b', long_name, 'a', 7, 3, float(long_float), 2.5, long_name])
+        self.assertEqual(tree.symbols, ['a', 'b', long_name])
+        self.assertEqual(tree.kind.tolist(), [LIST, NAME, NAME, NAME, INT, INT, FLOAT, FLOAT, NAME])
+    
+    def test_syntax_errors(self):
+        for bad in ['(+ 1 2', '(+ 1 2))', ')', '(+ 3x)', '(+ 99999999999999999999)',
+                    '(+ 1 %s)' % ('9' * 70), '(+ 1 %sx)' % ('1' * 70),
+                    '(+ 1_0)', '(+ 1\u0663)', '(+ 1 %s_1)' % ('1' * 70)]:
+            with self.assertRaises(SyntaxError):
+                parse(bad)
+
+
+class CompilerTests(ut.TestCase):
+    
+    def test_evaluate_examples(self):
+        self.assertEqual(evaluate('(+ 3 2)'), 5)
+        self.assertEqual(evaluate('(/ 100 314)'), 100 / 314)
+        self.assertEqual(evaluate('(/ -3 2)'), -1.5)
+        self.assertEqual(evaluate('(* 1 2 3 4 5)'), 120)
+        self.assertEqual(evaluate('(* (+ 1 (/ 10 2) 3) (* 4 3))'), 108)
+        self.assertEqual(evaluate('   ( -   10   3    )'), 7)
+        self.assertEqual(evaluate('(+ 3 1.2)'), 4.2)
+        self.assertEqual(evaluate('(- 10 3 2)'), 5)
+        self.assertEqual(evaluate('(- 4)'), -4)
+        self.assertEqual(evaluate('(/ 4)'), 0.25)
+    
+    def test_constant_folding(self):
+        self.assertEqual(compile_expression('(* (+ 1 (/ 10 2) 3) (* 4 3))').code, [(CONST, 0)])
+        program = compile_expression('(+ x (* 4 3))')
+        self.assertEqual(program.consts, [12])
+        self.assertEqual(program(x=1), 13)
+    
+    def test_free_symbols(self):
+        program = compile_expression('(+ (* a 2) b (- a) (/ b 4 2))')
+        self.assertEqual(program.names, ['a', 'b'])
+        self.assertEqual(program(a=3, b=8), 6 + 8 - 3 + 1)
+        self.assertEqual(program(a=0.5, b=0), 0.5)
+    
+    def test_cache(self):
+        self.assertIs(compile_expression('(+ 1 x)'), compile_expression('(+ 1 x)'))
+    
+    def test_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            evaluate('(/ 1 (- 2 2))')
+        for bad in ['()', '(hey whats up)', '((+ 1) 2)', '(-)', '(+ 1) (+ 2)']:
+            with self.assertRaises(SyntaxError):
+                compile_expression(bad)
+
+
+class ColumnTests(ut.TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.columns = {'a': rng.random(1000), 'b': rng.random(1000), 'c': rng.random(1000)}
+    
+    def test_matches_the_vm(self):
+        for source in ['(+ (* a 2) b)', '(- (* a b c 3) (/ a (+ b 1)) (- c) (/ c))',
+                       '(+ a (- b (- c (+ a (* b c)))))', 'a', '(* 2 3)']:
+            program = compile_expression(source)
+            expected = program(**self.columns)
+            for chunk_size in (7, 1 << 16):
+                result = run_columns(program, self.columns, chunk_size=chunk_size)
+                np.testing.assert_allclose(result, np.broadcast_to(expected, result.shape))
+    
+    def test_out_and_inputs(self):
+        out = np.zeros(1000)
+        before = self.columns['a'].copy()
+        self.assertIs(evaluate_columns('(+ a a 1)', self.columns, out=out), out)
+        np.testing.assert_allclose(out, 2 * before + 1)
+        np.testing.assert_array_equal(self.columns['a'], before)
+    
+    def test_out_aliasing_an_input(self):
+        for source in ['(+ b c a)', '(- (* a 2) (+ b a))']:
+            columns = {name: column.copy() for name, column in self.columns.items()}
+            expected = compile_expression(source)(**columns)
+            out = columns['a']
+            self.assertIs(evaluate_columns(source, columns, out=out), out)
+            np.testing.assert_allclose(out, expected)
+    
+    def test_dtypes_and_broadcasting(self):
+        result = evaluate_columns('(* a b 2)', {'a': np.arange(3)[:, None], 'b': np.arange(4)})
+        np.testing.assert_array_equal(result, 2 * np.arange(3)[:, None] * np.arange(4))
+        self.assertEqual(result.dtype, np.int64)
+        self.assertEqual(evaluate_columns('(/ a 2)', {'a': np.arange(4)}).dtype, np.float64)
+
+
+class CorpusTests(ut.TestCase):
+    # Regenerate test_cases.csv with `python corpus.py generate`
+    
+    def test_every_case(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_cases.csv')
+        rows = read_cases(path)
+        self.assertTrue(rows)
+        for number, row in enumerate(rows):
+            with self.subTest(case=number, kind=row['kind']):
+                self.assertIsNone(check_case(row))
+
+
 if __name__ == '__main__':
     # Run the tests
     ut.main(verbosity=2)
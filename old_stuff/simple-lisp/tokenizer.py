@@ -1,3 +1,32 @@
+import mmap
+import re
+
+import numpy as np
+
+# Token kinds, as yielded by token_spans. A NUMBER is any token starting like
+# one: a digit, optionally after a sign and/or a decimal point.
+LPAREN, RPAREN, NUMBER, SYMBOL = 1, 2, 3, 4
+
+# The same tokens as a regex, with the kind as the number of the matching
+# group. Used for str with non-ASCII characters, where byte offsets would
+# not be character offsets. re.ASCII, so that whitespace and digits are
+# exactly the ASCII ones the vectorized path knows.
+_TOKEN = re.compile(r'(\()|(\))|([-+]?\.?\d[^\s()]*)|([^\s()]+)', re.ASCII)
+
+# Byte classes for the vectorized path
+_SPACE, _ATOM = 0, 5
+_CLASS = np.full(256, _ATOM, dtype=np.uint8)
+_CLASS[list(b' \t\n\r\v\f')] = _SPACE
+_CLASS[ord('(')] = LPAREN
+_CLASS[ord(')')] = RPAREN
+_DIGIT = np.zeros(256, dtype=bool)
+_DIGIT[list(b'0123456789')] = True
+_SIGN = np.zeros(256, dtype=bool)
+_SIGN[list(b'+-')] = True
+_DOT = np.zeros(256, dtype=bool)
+_DOT[ord('.')] = True
+
+
 def tokenizer(instring):
     """
     generator
@@ -31,5 +60,91 @@ def tokenizer(instring):
         
         jj += 1
 
+
+def span_arrays(source):
+    """
+    (starts, ends, kinds) arrays of every token in source, without slicing
+    
+    The fast path: every byte is classified at once with NumPy, instead of
+    walking characters in Python. source[starts[ii]:ends[ii]] is token ii,
+    and kinds[ii] is one of LPAREN, RPAREN, NUMBER or SYMBOL. Unlike
+    tokenizer, any whitespace (tabs, newlines) splits tokens, so this works
+    on multi-line programs.
+    
+    source can be a str, or anything with the buffer protocol: bytes,
+    bytearray, memoryview or mmap.
+    """
+    if isinstance(source, str):
+        if not source.isascii():
+            matches = list(_TOKEN.finditer(source))
+            return (
+                np.array([match.start() for match in matches], dtype=np.int64),
+                np.array([match.end() for match in matches], dtype=np.int64),
+                np.array([match.lastindex for match in matches], dtype=np.uint8),
+            )
+        source = source.encode('ascii')
+    
+    data = np.frombuffer(source, dtype=np.uint8)
+    cls = _CLASS[data]
+    atom = cls == _ATOM
+    paren = (cls == LPAREN) | (cls == RPAREN)
+    
+    # A token starts at each paren, and where a run of atom bytes starts
+    starts_mask = paren.copy()
+    starts_mask[0:1] |= atom[0:1]
+    starts_mask[1:] |= atom[1:] & ~atom[:-1]
+    # ... and ends after each paren, and where a run of atom bytes ends
+    ends_mask = paren
+    ends_mask[-1:] |= atom[-1:]
+    ends_mask[:-1] |= atom[:-1] & ~atom[1:]
+    
+    starts = np.flatnonzero(starts_mask)
+    ends = np.flatnonzero(ends_mask) + 1
+    
+    kinds = cls[starts]
+    atoms = kinds == _ATOM
+    # the first three bytes of each atom, with the bytes past its end as spaces
+    padded = np.concatenate([data, np.full(2, ord(' '), dtype=np.uint8)])
+    first, second, third = padded[starts], padded[starts + 1], padded[starts + 2]
+    number = (
+        _DIGIT[first]
+        | (_SIGN[first] & _DIGIT[second])
+        | (_DOT[first] & _DIGIT[second])
+        | (_SIGN[first] & _DOT[second] & _DIGIT[third])
+    )
+    kinds[atoms & number] = NUMBER
+    kinds[atoms & ~number] = SYMBOL
+    return starts, ends, kinds
+
+
+def token_spans(source, chunk_size=1 << 20):
+    """
+    generator of (start, end, kind) for each token in source
+    
+    See span_arrays. source can also be a file-like object (text or binary),
+    which is read chunk_size characters at a time, so files of any size can
+    be tokenized. For files, start and end count from the position the file
+    was at, in characters for text files and bytes for binary ones.
+    """
+    if isinstance(source, (str, bytes, bytearray, memoryview, mmap.mmap)):
+        yield from zip(*(array.tolist() for array in span_arrays(source)))
+        return
+    
+    buffer = source.read(chunk_size)
+    offset = 0                          # position of buffer[0] in the file
+    while buffer:
+        chunk = source.read(chunk_size)
+        starts, ends, kinds = span_arrays(buffer)
+        keep = len(buffer)              # buffer[keep:] carries over
+        if chunk and len(ends) and ends[-1] == len(buffer):
+            # the last token may go on in the next chunk: rescan it with that
+            keep = int(starts[-1])
+            starts, ends, kinds = starts[:-1], ends[:-1], kinds[:-1]
+        
+        yield from zip((starts + offset).tolist(), (ends + offset).tolist(), kinds.tolist())
+        offset += keep
+        buffer = buffer[keep:] + chunk
+
+
 def tokenize(instring):
-    return list(tokenizer(instring))
+    return [instring[start:end] for start, end, __ in token_spans(instring)]